@@ -1,78 +1,174 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import ValidationError
+from pymongo.errors import DuplicateKeyError
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 import uuid
 
 from models.game import GameConfig, AdInteraction, Analytics, Event
 from models.user import Purchase
-from database import get_database
+from data.flutterers import FLUTTERERS, RARITY_PRICES, STARTER_PACK
+from database import get_database, projection
+from services.config import config_cache
+from services.events import events_cache
+from services.ingest import analytics_buffer, ads_buffer, BufferFull, iter_json_documents
+from services.purchases import purchase_update, recent_transactions
+from services.responses import PrerenderedJSON
+from services.shared_scores import record_shared_score
+from services.user_cache import get_user_cache
 
 router = APIRouter(prefix="/game", tags=["game"])
 
+MAX_ANALYTICS_BATCH = 5000
+
+# The catalog is static, so it is serialized once when the app starts
+FLUTTERER_CATALOG = PrerenderedJSON({
+    "flutterers": FLUTTERERS,
+    "pricing": RARITY_PRICES,
+    "starter_pack": STARTER_PACK
+}, max_age=3600)
+
 @router.get("/config", response_model=GameConfig)
 async def get_game_config(db=Depends(get_database)):
     """Get current game configuration"""
-    config = await db.game_config.find_one({"version": "1.0.0"})
-    
-    if not config:
-        # Create default config
-        default_config = GameConfig()
-        await db.game_config.insert_one(default_config.dict())
-        return default_config
-    
-    return GameConfig(**config)
+    return await config_cache.current(db)
 
 @router.get("/events", response_model=List[Event])
 async def get_active_events(db=Depends(get_database)):
     """Get currently active events"""
-    now = datetime.utcnow()
-    
-    events = await db.events.find({
-        "active": True,
-        "start_date": {"$lte": now},
-        "end_date": {"$gte": now}
-    }).to_list(100)
-    
-    return [Event(**event) for event in events]
+    return await events_cache.active_events(db, datetime.utcnow())
 
 @router.post("/analytics")
-async def track_event(analytics_data: Analytics, db=Depends(get_database)):
+async def track_event(analytics_data: Analytics):
     """Track analytics event"""
-    await db.analytics.insert_one(analytics_data.dict())
+    try:
+        await analytics_buffer.put(analytics_data.dict())
+    except BufferFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Analytics queue full, retry later",
+            headers={"Retry-After": "1"}
+        )
     return {"success": True}
 
+@router.post("/analytics/batch")
+async def track_events(request: Request):
+    """Track a batch of analytics events sent as a JSON array or NDJSON.
+    
+    Events are queued as they are parsed, so every response, errors
+    included, says how many were accepted and the index of the first event
+    to resend. Events past MAX_ANALYTICS_BATCH are not read and the
+    response is marked `truncated`.
+    """
+    accepted = 0
+    rejected = []
+    index = -1
+    truncated = False
+    
+    try:
+        async for event in iter_json_documents(request.stream()):
+            index += 1
+            if index >= MAX_ANALYTICS_BATCH:
+                truncated = True
+                break
+            
+            try:
+                analytics_data = Analytics(**event)
+            except ValidationError as e:
+                rejected.append({
+                    "index": index,
+                    "error": e.errors(include_url=False, include_context=False, include_input=False)
+                })
+                continue
+            
+            await analytics_buffer.put(analytics_data.dict())
+            accepted += 1
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=batch_progress(f"Invalid event stream: {e}", accepted, rejected, index + 1)
+        )
+    except BufferFull:
+        raise HTTPException(
+            status_code=503,
+            detail=batch_progress("Analytics queue full, retry later", accepted, rejected, index),
+            headers={"Retry-After": "1"}
+        )
+    
+    return {
+        "success": True,
+        **batch_progress(None, accepted, rejected, index if truncated else None),
+        "truncated": truncated
+    }
+
+def batch_progress(message: Optional[str], accepted: int, rejected: list, next_index: Optional[int]) -> dict:
+    """How far a batch got; `next_index` is the first event the client should resend"""
+    progress = {"accepted": accepted, "rejected": rejected, "next_index": next_index}
+    if message:
+        progress["message"] = message
+    return progress
+
 @router.post("/ad/rewarded")
-async def watch_rewarded_ad(user_id: str, ad_type: str = "extra_life", db=Depends(get_database)):
+async def watch_rewarded_ad(
+    user_id: str,
+    ad_type: str = "extra_life",
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
     """Process rewarded ad interaction"""
     
-    # Get user
-    user = await db.users.find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    config = config_cache.get()
+    now = datetime.utcnow()
+    today = now.date().isoformat()
     
-    # Check cooldown
-    last_ad = user.get("last_rewarded_ad")
-    if last_ad:
-        cooldown_minutes = 5  # From game config
-        if datetime.utcnow() - last_ad < timedelta(minutes=cooldown_minutes):
-            raise HTTPException(status_code=429, detail="Ad cooldown active")
+    # Process reward
+    reward_amount = config.coin_ad_reward if ad_type == "coins" else 1  # 1 extra life or coins
     
-    # Check daily limit
-    today = datetime.utcnow().date()
-    daily_ads = await db.ads.count_documents({
-        "user_id": user_id,
-        "ad_type": "rewarded",
-        "timestamp": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today + timedelta(days=1), datetime.min.time())
-        }
-    })
+    # Cooldown, daily limit and reward in one conditional update
+    update = {
+        "rewarded_ads_today": {"$cond": [
+            {"$eq": ["$rewarded_ads_date", today]},
+            {"$add": [{"$ifNull": ["$rewarded_ads_today", 0]}, 1]},
+            1
+        ]},
+        "rewarded_ads_date": today,
+        "last_rewarded_ad": now,
+        "ad_interactions": {"$add": [{"$ifNull": ["$ad_interactions", 0]}, 1]},
+        "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]}
+    }
     
-    if daily_ads >= 10:  # Max per day
-        raise HTTPException(status_code=429, detail="Daily ad limit reached")
+    if ad_type == "coins":
+        update["cosmic_coins"] = {"$add": [{"$ifNull": ["$cosmic_coins", 0]}, reward_amount]}
     
-    # Process reward
-    reward_amount = 25 if ad_type == "coins" else 1  # 1 extra life or 25 coins
+    result = await db.users.update_one(
+        {
+            "user_id": user_id,
+            "$and": [
+                {"$or": [
+                    {"last_rewarded_ad": None},
+                    {"last_rewarded_ad": {"$lte": now - timedelta(minutes=config.ad_cooldown_minutes)}}
+                ]},
+                {"$or": [
+                    {"rewarded_ads_date": {"$ne": today}},
+                    {"rewarded_ads_today": {"$lt": config.max_rewarded_ads_per_day}}
+                ]}
+            ]
+        },
+        [{"$set": update}]
+    )
+    
+    if not result.matched_count:
+        # Work out which check rejected the ad
+        user = await db.users.find_one({"user_id": user_id}, projection(["last_rewarded_ad"]))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        last_ad = user.get("last_rewarded_ad")
+        if last_ad and now - last_ad < timedelta(minutes=config.ad_cooldown_minutes):
+            raise HTTPException(status_code=429, detail="Ad cooldown active")
+        
+        raise HTTPException(status_code=429, detail="Daily ad limit reached")
+    cache.invalidate(user_id)
     
     # Record ad interaction
     ad_interaction = AdInteraction(
@@ -81,21 +177,14 @@ async def watch_rewarded_ad(user_id: str, ad_type: str = "extra_life", db=Depend
         ad_network="admob",
         reward_given=True,
         reward_type=ad_type,
-        reward_amount=reward_amount
+        reward_amount=reward_amount,
+        timestamp=now
     )
     
-    await db.ads.insert_one(ad_interaction.dict())
-    
-    # Update user
-    update_data = {
-        "$set": {"last_rewarded_ad": datetime.utcnow()},
-        "$inc": {"ad_interactions": 1}
-    }
-    
-    if ad_type == "coins":
-        update_data["$inc"]["cosmic_coins"] = reward_amount
-    
-    await db.users.update_one({"user_id": user_id}, update_data)
+    try:
+        await ads_buffer.put(ad_interaction.dict())
+    except BufferFull:
+        await db.ads.insert_one(ad_interaction.dict())
     
     return {
         "success": True,
@@ -104,62 +193,106 @@ async def watch_rewarded_ad(user_id: str, ad_type: str = "extra_life", db=Depend
     }
 
 @router.post("/purchase/verify")
-async def verify_purchase(purchase_data: Purchase, db=Depends(get_database)):
-    """Verify and process in-app purchase"""
+async def verify_purchase(purchase_data: Purchase, db=Depends(get_database), cache=Depends(get_user_cache)):
+    """Verify and process in-app purchase, at most once per transaction"""
     
     # In production, verify with Google Play/App Store
     # For now, we'll assume all purchases are valid
     
-    user = await db.users.find_one({"user_id": purchase_data.user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    transaction_id = purchase_data.transaction_id
+    if not transaction_id:
+        raise HTTPException(status_code=400, detail="transaction_id is required")
     
-    # Process purchase based on item type
-    if purchase_data.item_type == "flutterer":
-        # Unlock flutterer
-        await unlock_flutterer_purchase(purchase_data.user_id, purchase_data.item_id, db)
+    seen = recent_transactions.get(transaction_id)
+    if seen:
+        return purchase_replay(purchase_data, *seen)
     
-    elif purchase_data.item_type == "starter_pack":
-        # Process starter pack
-        await process_starter_pack(purchase_data.user_id, db)
+    # Claim the transaction globally before granting anything
+    purchase = purchase_data.dict()
+    claimed, existing = await claim_transaction(db, purchase)
+    if not claimed:
+        if existing is None:
+            # The claim was released because its user doesn't exist
+            raise HTTPException(status_code=404, detail="User not found")
+        if existing["user_id"] != purchase_data.user_id or existing.get("granted"):
+            return purchase_replay(purchase_data, existing["user_id"], existing["purchase_id"])
+        # Claimed by an earlier attempt that may have died before granting
+        purchase["purchase_id"] = existing["purchase_id"]
     
-    elif purchase_data.item_type == "coins":
-        # Add coins
-        coin_amounts = {"small": 500, "medium": 1200, "large": 2500}
-        coins = coin_amounts.get(purchase_data.item_id, 500)
-        
-        await db.users.update_one(
-            {"user_id": purchase_data.user_id},
-            {"$inc": {"cosmic_coins": coins}}
-        )
+    # The user's recent transaction IDs guard the grant; a replay matches nothing
+    result = await db.users.update_one(
+        {"user_id": purchase_data.user_id, "granted_transactions": {"$ne": transaction_id}},
+        purchase_update(purchase, datetime.utcnow())
+    )
     
-    # Save purchase record
-    await db.purchases.insert_one(purchase_data.dict())
+    if result.matched_count:
+        cache.invalidate(purchase_data.user_id)
+    elif not await db.users.find_one({"user_id": purchase_data.user_id}, projection(["user_id"])):
+        await db.purchases.delete_one({"transaction_id": transaction_id, "granted": False})
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await db.purchases.update_one({"transaction_id": transaction_id}, {"$set": {"granted": True}})
+    
+    recent_transactions.add(transaction_id, purchase_data.user_id, purchase["purchase_id"])
+    return {
+        "success": True,
+        "purchase_id": purchase["purchase_id"],
+        "duplicate": not result.matched_count
+    }
+
+async def claim_transaction(db, purchase: dict, attempts: int = 2) -> tuple:
+    """Insert the purchase record, or return the one that already claimed it.
     
-    return {"success": True, "purchase_id": purchase_data.purchase_id}
+    Returns (True, None) for a new claim and (False, existing) otherwise.
+    `existing` is None if the claim keeps disappearing, which only happens
+    when it is released for a user that doesn't exist.
+    """
+    existing = None
+    for _ in range(attempts):
+        try:
+            await db.purchases.insert_one({**purchase, "granted": False})
+            return True, None
+        except DuplicateKeyError:
+            existing = await db.purchases.find_one(
+                {"transaction_id": purchase["transaction_id"]},
+                projection(["user_id", "purchase_id", "granted"])
+            )
+            if existing is not None:
+                break
+    return False, existing
+
+def purchase_replay(purchase_data: Purchase, user_id: str, purchase_id: str) -> dict:
+    """Response for a transaction that has already been granted"""
+    if user_id != purchase_data.user_id:
+        raise HTTPException(status_code=409, detail="Transaction already used by another user")
+    return {"success": True, "purchase_id": purchase_id, "duplicate": True}
 
 @router.post("/share-score")
-async def share_score(user_id: str, score: int, platform: str, db=Depends(get_database)):
+async def share_score(
+    user_id: str,
+    score: int,
+    platform: str,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
     """Process score sharing for social features"""
     
-    user = await db.users.find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     # Award coins for sharing
-    share_reward = 15
+    share_reward = config_cache.get().share_score_coin_reward
     
-    await db.users.update_one(
+    result = await db.users.update_one(
         {"user_id": user_id},
-        {
-            "$inc": {"cosmic_coins": share_reward},
-            "$push": {"shared_scores": {
-                "score": score,
-                "platform": platform,
-                "timestamp": datetime.utcnow()
-            }}
-        }
+        {"$inc": {"cosmic_coins": share_reward, "revision": 1}}
     )
+    cache.invalidate(user_id)
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    await record_shared_score(db, user_id, {
+        "score": score,
+        "platform": platform,
+        "timestamp": datetime.utcnow()
+    })
     
     return {
         "success": True,
@@ -167,40 +300,7 @@ async def share_score(user_id: str, score: int, platform: str, db=Depends(get_da
     }
 
 @router.get("/flutterers")
-async def get_flutterer_catalog():
+async def get_flutterer_catalog(request: Request):
     """Get all available flutterers with pricing"""
     # This would typically come from database, but for now return static data
-    from data.flutterers import FLUTTERERS, RARITY_PRICES, STARTER_PACK
-    
-    return {
-        "flutterers": FLUTTERERS,
-        "pricing": RARITY_PRICES,
-        "starter_pack": STARTER_PACK
-    }
-
-async def unlock_flutterer_purchase(user_id: str, flutterer_id: str, db):
-    """Unlock flutterer via purchase"""
-    await db.users.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                f"flutterer_progress.{flutterer_id}": {
-                    "flutterer_id": flutterer_id,
-                    "unlocked": True,
-                    "purchase_date": datetime.utcnow(),
-                    "usage_count": 0
-                }
-            }
-        }
-    )
-
-async def process_starter_pack(user_id: str, db):
-    """Process starter pack purchase"""
-    # Unlock Epic Blaster Wing
-    await unlock_flutterer_purchase(user_id, "epic_blaster_wing", db)
-    
-    # Add 1000 coins
-    await db.users.update_one(
-        {"user_id": user_id},
-        {"$inc": {"cosmic_coins": 1000}}
-    )
\ No newline at end of file
+    return FLUTTERER_CATALOG.response(request)
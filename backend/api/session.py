@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from datetime import datetime
+import asyncio
+
+from models.user import LeaderboardEntry, UserProfile
+from database import get_database
+from api.game import FLUTTERER_CATALOG, get_active_events
+from services.challenges import todays_challenges
+from services.config import config_cache
+from services.leaderboard import get_top_scores, add_ranks, leaderboard_snapshot
+from services.responses import render_json, make_etag, etag_matches
+from services.user_cache import get_user_cache
+
+router = APIRouter(prefix="/session", tags=["session"])
+
+BOOTSTRAP_LEADERBOARD_SIZE = 50
+HEALTH = render_json({"status": "healthy", "version": "1.0.0"})
+
+@router.get("/bootstrap")
+async def bootstrap_session(
+    user_id: str,
+    request: Request,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
+    """Everything the client loads on launch, in one round trip.
+    
+    Each section carries its own ETag. Sections whose ETag the client sends
+    in If-None-Match are listed under `unchanged` instead of being resent.
+    """
+    config, events, user, leaderboard = await asyncio.gather(
+        config_cache.current(db),
+        get_active_events(db),
+        cache.get_or_load(db, user_id),
+        leaderboard_section(db)
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    sections = {
+        "health": HEALTH,
+        "config": render_json(config),
+        "flutterers": FLUTTERER_CATALOG.body,
+        "events": render_json(events),
+        "user": render_json(UserProfile(**user)),
+        "daily_challenges": render_json(todays_challenges(user, datetime.utcnow())),
+        "leaderboard": leaderboard
+    }
+    
+    # Splice the already-serialized sections into one document
+    known = request.headers.get("if-none-match")
+    parts = []
+    unchanged = []
+    for name, body in sections.items():
+        etag = FLUTTERER_CATALOG.etag if name == "flutterers" else make_etag(body)
+        if etag_matches(known, etag):
+            unchanged.append(name)
+            continue
+        parts.append(b'"%s":{"etag":%s,"data":%s}' % (name.encode(), render_json(etag), body))
+    
+    body = b'{"sections":{' + b",".join(parts) + b'},"unchanged":' + render_json(unchanged) + b"}"
+    
+    # CompressionMiddleware negotiates gzip or brotli for the whole payload
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"Cache-Control": "private, no-cache", "Vary": "If-None-Match"}
+    )
+
+async def leaderboard_section(db) -> bytes:
+    """Top of the global leaderboard, from the snapshot when it is fresh"""
+    rendered = leaderboard_snapshot.top(BOOTSTRAP_LEADERBOARD_SIZE)
+    if rendered is not None:
+        return rendered.body
+    
+    entries = add_ranks(await get_top_scores(db, BOOTSTRAP_LEADERBOARD_SIZE), 1)
+    return render_json([LeaderboardEntry(**entry) for entry in entries])
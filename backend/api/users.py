@@ -1,23 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional
 from datetime import datetime, timedelta
-import uuid
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-from models.user import User, UserCreate, UserUpdate, ScoreSubmission, LeaderboardEntry
-from database import get_database
+from models.user import (
+    User, UserProfile, UserCreate, UserUpdate, ScoreSubmission, LeaderboardEntry, LeaderboardPage,
+    SharedScorePage, DailyChallenge
+)
+from models.game import GameConfig
+from database import get_database, projection
+from services.bus import publish
+from services.challenges import (
+    todays_challenges, evaluate_challenges, challenge_progress_stage, CHALLENGE_REWARD_EXPRESSION
+)
+from services.config import config_cache
+from services.leaderboard import (
+    record_best_score, record_windowed_scores, get_top_scores, get_scores_page, get_scores_around,
+    get_window_scores, get_friends_scores, window_key, friends_boards, leaderboard_snapshot
+)
+from services.ranking import rank_index
+from services.responses import TrustedJSONResponse
+from services.shared_scores import get_shared_scores_page
+from services.user_cache import get_user_cache, project_document, UNCACHED_FIELDS
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.post("/register", response_model=User)
-async def register_user(user_data: UserCreate, db=Depends(get_database)):
+async def register_user(user_data: UserCreate, db=Depends(get_database), cache=Depends(get_user_cache)):
     """Register a new user"""
     
-    # Check if device_id already exists
-    existing_user = await db.users.find_one({"device_id": user_data.device_id})
-    if existing_user:
-        # Return existing user for device
-        return User(**existing_user)
-    
     # Create new user with starter flutterer unlocked
     user = User(
         username=user_data.username,
@@ -26,188 +38,437 @@ async def register_user(user_data: UserCreate, db=Depends(get_database)):
         email=user_data.email,
         flutterer_progress={"basic_cosmic": {"flutterer_id": "basic_cosmic", "unlocked": True}}
     )
+    new_user = {k: v for k, v in user.dict().items() if k != "device_id"}
+    
+    # Insert the user unless the device is already registered, in one round trip
+    try:
+        existing_or_new = await db.users.find_one_and_update(
+            {"device_id": user_data.device_id},
+            {"$setOnInsert": new_user},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent registration for the same device won the insert
+        existing_or_new = await db.users.find_one({"device_id": user_data.device_id}, {"_id": 0})
     
-    # Insert user into database
-    result = await db.users.insert_one(user.dict())
-    user.user_id = str(result.inserted_id)
-    
-    # Update the user record with the correct user_id
-    await db.users.update_one(
-        {"_id": result.inserted_id},
-        {"$set": {"user_id": user.user_id}}
+    cache.put(existing_or_new)
+    return User(**existing_or_new)
+
+@router.get("/{user_id}", response_model=User)
+async def get_user(
+    user_id: str,
+    fields: Optional[str] = None,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
+    """Get user by ID, optionally only the comma-separated `fields`"""
+    requested = parse_user_fields(fields) if fields else None
+    
+    if requested and not any(field.split(".")[0] in UNCACHED_FIELDS for field in requested):
+        user = await cache.get_or_load(db, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        # Partial documents skip response_model validation
+        return TrustedJSONResponse(project_document(user, requested))
+    
+    # The cache doesn't hold the unbounded histories, so read them with a real projection
+    user = await db.users.find_one(
+        {"user_id": user_id},
+        projection(["user_id", *requested]) if requested else {"_id": 0}
     )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    return user
+    if requested:
+        return TrustedJSONResponse(project_document(user, requested))
+    return TrustedJSONResponse(User(**user))
 
-@router.get("/{user_id}", response_model=User)
-async def get_user(user_id: str, db=Depends(get_database)):
-    """Get user by ID"""
-    user = await db.users.find_one({"user_id": user_id})
+@router.get("/{user_id}/profile", response_model=UserProfile)
+async def get_user_profile(user_id: str, db=Depends(get_database), cache=Depends(get_user_cache)):
+    """Get user without purchase, sharing and friend histories"""
+    user = await cache.get_or_load(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return User(**user)
+    return TrustedJSONResponse(UserProfile(**user))
+
+@router.get("/{user_id}/shared-scores", response_model=SharedScorePage)
+async def get_shared_scores(user_id: str, cursor: Optional[str] = None, db=Depends(get_database)):
+    """Get a page of the user's shared scores, newest first"""
+    try:
+        page = await get_shared_scores_page(db, user_id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SharedScorePage(**page)
 
 @router.put("/{user_id}", response_model=User)
-async def update_user(user_id: str, user_update: UserUpdate, db=Depends(get_database)):
+async def update_user(
+    user_id: str,
+    user_update: UserUpdate,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
     """Update user profile"""
-    user = await db.users.find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     update_data = {k: v for k, v in user_update.dict().items() if v is not None}
     update_data["last_active"] = datetime.utcnow()
     
-    await db.users.update_one({"user_id": user_id}, {"$set": update_data})
+    updated_user = await db.users.find_one_and_update(
+        {"user_id": user_id},
+        {"$set": update_data, "$inc": {"revision": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    updated_user = await db.users.find_one({"user_id": user_id})
+    cache.replace(updated_user)
     return User(**updated_user)
 
 @router.post("/{user_id}/score", response_model=dict)
-async def submit_score(user_id: str, score_data: ScoreSubmission, db=Depends(get_database)):
+async def submit_score(
+    user_id: str,
+    score_data: ScoreSubmission,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
     """Submit a game score"""
-    user = await db.users.find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user_obj = User(**user)
-    
-    # Update user stats
-    coins_awarded = 0
-    new_record = False
-    
-    if score_data.score > user_obj.game_stats.high_score:
-        user_obj.game_stats.high_score = score_data.score
-        coins_awarded += 50  # High score bonus
-        new_record = True
-    
-    if score_data.level > user_obj.game_stats.max_level:
-        user_obj.game_stats.max_level = score_data.level
-        coins_awarded += score_data.level * 10  # Level progression bonus
+    results, total_coins, completed = await apply_scores(user_id, [score_data], db, cache)
     
-    # Update cumulative stats
-    user_obj.game_stats.enemies_defeated += score_data.enemies_defeated
-    user_obj.game_stats.total_survival_time += score_data.survival_time
-    user_obj.game_stats.games_played += 1
-    
-    # Base coin reward
-    coins_awarded += int(score_data.score * 0.01) + 10
-    user_obj.cosmic_coins += coins_awarded
-    
-    # Update last active
-    user_obj.last_active = datetime.utcnow()
-    
-    # Save to database
-    await db.users.update_one(
-        {"user_id": user_id}, 
-        {"$set": user_obj.dict()}
-    )
-    
-    # Save score to leaderboard
-    leaderboard_entry = {
-        "user_id": user_id,
-        "username": user_obj.username,
-        "score": score_data.score,
-        "level": score_data.level,
-        "flutterer_used": score_data.flutterer_used,
-        "timestamp": score_data.timestamp,
-        "session_id": score_data.session_id
+    return {
+        "success": True,
+        "coins_awarded": results[0]["coins_awarded"],
+        "new_record": results[0]["new_record"],
+        "completed_challenges": completed,
+        "total_coins": total_coins,
+        "rank": await get_user_rank(user_id, db)
     }
-    await db.leaderboard.insert_one(leaderboard_entry)
+
+@router.post("/{user_id}/score/batch", response_model=dict)
+async def submit_scores(
+    user_id: str,
+    scores: List[ScoreSubmission],
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
+    """Submit a batch of game scores queued while offline"""
+    if not scores:
+        raise HTTPException(status_code=400, detail="No scores submitted")
+    if len(scores) > MAX_SCORE_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SCORE_BATCH} scores per batch")
+    
+    results, total_coins, completed = await apply_scores(user_id, scores, db, cache)
     
     return {
         "success": True,
-        "coins_awarded": coins_awarded,
-        "new_record": new_record,
-        "total_coins": user_obj.cosmic_coins,
+        "results": results,
+        "coins_awarded": sum(result["coins_awarded"] for result in results),
+        "new_record": any(result["new_record"] for result in results),
+        "completed_challenges": completed,
+        "total_coins": total_coins,
         "rank": await get_user_rank(user_id, db)
     }
 
 @router.get("/{user_id}/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(user_id: str, limit: int = 50, db=Depends(get_database)):
+async def get_leaderboard(user_id: str, request: Request, limit: int = 50, db=Depends(get_database)):
     """Get global leaderboard"""
     
-    # Aggregate leaderboard with ranking
-    pipeline = [
-        {"$group": {
-            "_id": "$user_id",
-            "username": {"$first": "$username"},
-            "score": {"$max": "$score"},
-            "level": {"$max": "$level"},
-            "flutterer_used": {"$last": "$flutterer_used"},
-            "timestamp": {"$last": "$timestamp"}
-        }},
-        {"$sort": {"score": -1}},
-        {"$limit": limit},
-        {"$addFields": {"user_id": "$_id"}},
-        {"$project": {"_id": 0}}
-    ]
+    # Serve the precomputed snapshot when it is fresh enough
+    snapshot = leaderboard_snapshot.response(request, limit)
+    if snapshot is not None:
+        return snapshot
     
-    leaderboard = await db.leaderboard.aggregate(pipeline).to_list(limit)
+    # Read from the materialized best-score collection
+    leaderboard = await get_top_scores(db, limit)
     
     # Add ranking
     for i, entry in enumerate(leaderboard):
         entry["rank"] = i + 1
     
-    return [LeaderboardEntry(**entry) for entry in leaderboard]
+    return TrustedJSONResponse([LeaderboardEntry(**entry) for entry in leaderboard])
+
+@router.get("/{user_id}/leaderboard/page", response_model=LeaderboardPage)
+async def get_leaderboard_page(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    db=Depends(get_database)
+):
+    """Get a page of the global leaderboard, continuing from `cursor`"""
+    try:
+        entries, next_cursor = await get_scores_page(db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return TrustedJSONResponse(LeaderboardPage(
+        entries=[LeaderboardEntry(**entry) for entry in entries],
+        next_cursor=next_cursor
+    ))
+
+@router.get("/{user_id}/leaderboard/around", response_model=List[LeaderboardEntry])
+async def get_leaderboard_around(
+    user_id: str,
+    count: int = Query(10, ge=1, le=50),
+    db=Depends(get_database)
+):
+    """Get the players ranked directly above and below the user"""
+    entries = await get_scores_around(db, user_id, count)
+    return TrustedJSONResponse([LeaderboardEntry(**entry) for entry in entries])
+
+@router.get("/{user_id}/leaderboard/friends", response_model=List[LeaderboardEntry])
+async def get_friends_leaderboard(user_id: str, db=Depends(get_database)):
+    """Get the leaderboard of the user and their friends"""
+    entries = friends_boards.get(user_id)
+    
+    if entries is None:
+        # Friends aren't in the user cache
+        user = await db.users.find_one({"user_id": user_id}, projection(["user_id", "friends"]))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        friends = user.get("friends", [])
+        entries = await get_friends_scores(db, user_id, friends)
+        friends_boards.put(user_id, [user_id, *friends], entries)
+    
+    return TrustedJSONResponse([LeaderboardEntry(**entry) for entry in entries])
+
+@router.get("/{user_id}/leaderboard/period/{period}", response_model=List[LeaderboardEntry])
+async def get_period_leaderboard(
+    user_id: str,
+    period: str,
+    event_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    db=Depends(get_database)
+):
+    """Get the current daily or weekly leaderboard, or an event's leaderboard"""
+    if period == "event" and not event_id:
+        raise HTTPException(status_code=400, detail="event_id is required for event leaderboards")
+    
+    try:
+        window = window_key(period, datetime.utcnow(), event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    entries = await get_window_scores(db, window, limit)
+    return TrustedJSONResponse([LeaderboardEntry(**entry) for entry in entries])
 
 @router.post("/{user_id}/flutterer/unlock")
-async def unlock_flutterer(user_id: str, flutterer_id: str, db=Depends(get_database)):
+async def unlock_flutterer(
+    user_id: str,
+    flutterer_id: str,
+    db=Depends(get_database),
+    cache=Depends(get_user_cache)
+):
     """Unlock a flutterer for user"""
-    user = await db.users.find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user_obj = User(**user)
     
     # Add flutterer to progress
-    user_obj.flutterer_progress[flutterer_id] = {
-        "flutterer_id": flutterer_id,
-        "unlocked": True,
-        "usage_count": 0
-    }
-    
-    await db.users.update_one(
+    result = await db.users.update_one(
         {"user_id": user_id},
-        {"$set": {f"flutterer_progress.{flutterer_id}": {
-            "flutterer_id": flutterer_id,
-            "unlocked": True,
-            "usage_count": 0
-        }}}
+        {
+            "$set": {f"flutterer_progress.{flutterer_id}": {
+                "flutterer_id": flutterer_id,
+                "unlocked": True,
+                "usage_count": 0
+            }},
+            "$inc": {"revision": 1}
+        }
     )
+    cache.invalidate(user_id)
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="User not found")
     
     return {"success": True, "flutterer_id": flutterer_id}
 
-@router.get("/{user_id}/daily-challenges")
-async def get_daily_challenges(user_id: str, db=Depends(get_database)):
+@router.get("/{user_id}/daily-challenges", response_model=List[DailyChallenge])
+async def get_daily_challenges(user_id: str, db=Depends(get_database), cache=Depends(get_user_cache)):
     """Get user's daily challenges"""
-    user = await db.users.find_one({"user_id": user_id})
+    user = await cache.get_or_load(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_obj = User(**user)
+    # Today's set is derived, not stored; only progress lives on the user
+    return TrustedJSONResponse(todays_challenges(user, datetime.utcnow()))
+
+def parse_user_fields(fields: str) -> List[str]:
+    """Validate a comma-separated `fields` parameter against the User model"""
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field.split(".")[0] not in User.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown user fields: {', '.join(unknown)}")
+    
+    # Drop sub-fields of requested fields, MongoDB rejects overlapping paths
+    return [
+        field for field in requested
+        if not any(field.startswith(parent + ".") for parent in requested)
+    ]
+
+# Record bonuses for a submitted run; the per-run reward comes from GameConfig
+HIGH_SCORE_BONUS = 50
+LEVEL_BONUS_PER_LEVEL = 10
+
+MAX_SCORE_BATCH = 100
+
+# Fields apply_scores needs from the pre-update user document
+SCORE_PROJECTION = {
+    "_id": 0,
+    "username": 1,
+    "cosmic_coins": 1,
+    "game_stats.high_score": 1,
+    "game_stats.max_level": 1,
+    "daily_challenges": 1,
+    "revision": 1
+}
+
+async def apply_scores(user_id: str, scores: List[ScoreSubmission], db, cache):
+    """Fold runs into the user's stats and record them on the leaderboard.
+    
+    Returns the per-run results, the user's coin total afterwards and the
+    daily challenges the runs completed.
+    """
     
-    # Generate new daily challenges if needed
-    today = datetime.utcnow().date()
+    config = config_cache.get()
+    now = datetime.utcnow()
     
-    # Check if challenges are from today
-    current_challenges = [c for c in user_obj.daily_challenges 
-                         if c.get('created_date', datetime.min).date() == today]
+    # Apply stats and coins in one atomic update and read back the prior values
+    user = await db.users.find_one_and_update(
+        {"user_id": user_id},
+        score_update_pipeline(user_id, scores, config, now),
+        projection=SCORE_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    cache.invalidate(user_id, user.get("revision", 0) + 1)
+    
+    previous_stats = user.get("game_stats", {})
+    previous_high_score = previous_stats.get("high_score", 0)
+    results = score_rewards(previous_high_score, previous_stats.get("max_level", 1), scores, config)
+    completed = evaluate_challenges({**user, "user_id": user_id}, scores, now)
+    total_coins = (
+        user.get("cosmic_coins", 0)
+        + sum(result["coins_awarded"] for result in results)
+        + sum(challenge.reward_coins for challenge in completed)
+    )
+    
+    best = max(scores, key=lambda score_data: score_data.score)
+    rank_index.update(user_id, max(previous_high_score, best.score))
+    if best.score > previous_high_score:
+        friends_boards.member_improved(user_id)
+        publish("leaderboard", {"user_id": user_id, "score": best.score})
     
-    if not current_challenges:
-        # Generate new challenges
-        new_challenges = await generate_daily_challenges(user_id, db)
-        user_obj.daily_challenges = new_challenges
+    # Save scores to leaderboard
+    leaderboard_entries = [{
+        "user_id": user_id,
+        "username": user["username"],
+        "score": score_data.score,
+        "level": score_data.level,
+        "flutterer_used": score_data.flutterer_used,
+        "timestamp": score_data.timestamp,
+        "session_id": score_data.session_id
+    } for score_data in scores]
+    
+    await record_best_score(db, leaderboard_entries[scores.index(best)])
+    await record_windowed_scores(db, leaderboard_entries[scores.index(best)], now)
+    await db.leaderboard.insert_many(leaderboard_entries, ordered=False)
+    
+    return results, total_coins, completed
+
+def run_coins(score_data: ScoreSubmission, config: GameConfig) -> int:
+    """Coins every run earns regardless of records"""
+    return int(score_data.score * config.score_multiplier) + config.base_coin_reward
+
+def score_rewards(
+    high_score: int,
+    max_level: int,
+    scores: List[ScoreSubmission],
+    config: GameConfig
+) -> list:
+    """Compute coins_awarded and new_record per run against the prior stats"""
+    results = []
+    
+    for score_data in scores:
+        coins_awarded = run_coins(score_data, config)
+        new_record = score_data.score > high_score
         
-        await db.users.update_one(
-            {"user_id": user_id},
-            {"$set": {"daily_challenges": [c.dict() for c in new_challenges]}}
-        )
+        if new_record:
+            high_score = score_data.score
+            coins_awarded += HIGH_SCORE_BONUS
+        
+        if score_data.level > max_level:
+            max_level = score_data.level
+            coins_awarded += score_data.level * LEVEL_BONUS_PER_LEVEL
+        
+        results.append({
+            "session_id": score_data.session_id,
+            "coins_awarded": coins_awarded,
+            "new_record": new_record
+        })
     
-    return user_obj.daily_challenges
+    return results
+
+def score_update_pipeline(user_id: str, scores: List[ScoreSubmission], config: GameConfig, now: datetime) -> list:
+    """Update pipeline applying runs to the user's stats, challenges and coins.
+    
+    Every expression reads the pre-update document, so the bonuses match
+    what score_rewards computes from the values returned by the update. A
+    run can only earn a record bonus if it beats the earlier runs in the
+    batch, which is known up front, and the stored stats, which is checked
+    server-side. Daily challenge progress is evaluated in a stage of its
+    own so the coins can include the rewards for challenges it completed.
+    """
+    high_score = {"$ifNull": ["$game_stats.high_score", 0]}
+    max_level = {"$ifNull": ["$game_stats.max_level", 1]}
+    
+    coins = [
+        {"$ifNull": ["$cosmic_coins", 0]},
+        sum(run_coins(score_data, config) for score_data in scores),
+        CHALLENGE_REWARD_EXPRESSION
+    ]
+    batch_high_score = batch_max_level = None
+    
+    for score_data in scores:
+        if batch_high_score is None or score_data.score > batch_high_score:
+            batch_high_score = score_data.score
+            coins.append({"$cond": [{"$gt": [score_data.score, high_score]}, HIGH_SCORE_BONUS, 0]})
+        
+        if batch_max_level is None or score_data.level > batch_max_level:
+            batch_max_level = score_data.level
+            coins.append({"$cond": [
+                {"$gt": [score_data.level, max_level]},
+                score_data.level * LEVEL_BONUS_PER_LEVEL,
+                0
+            ]})
+    
+    return [challenge_progress_stage(user_id, scores, now), {"$set": {
+        "cosmic_coins": {"$add": coins},
+        "game_stats.high_score": {"$max": [high_score, batch_high_score]},
+        "game_stats.max_level": {"$max": [max_level, batch_max_level]},
+        "game_stats.enemies_defeated": {"$add": [
+            {"$ifNull": ["$game_stats.enemies_defeated", 0]},
+            sum(score_data.enemies_defeated for score_data in scores)
+        ]},
+        "game_stats.total_survival_time": {"$add": [
+            {"$ifNull": ["$game_stats.total_survival_time", 0]},
+            sum(score_data.survival_time for score_data in scores)
+        ]},
+        "game_stats.games_played": {"$add": [
+            {"$ifNull": ["$game_stats.games_played", 0]}, len(scores)
+        ]},
+        "last_active": now,
+        "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]}
+    }}, {
+        # Drop the temporary flags challenge_progress_stage added
+        "$project": {"daily_challenges._rewarded": 0}
+    }]
 
 async def get_user_rank(user_id: str, db) -> int:
     """Get user's rank on leaderboard"""
-    user = await db.users.find_one({"user_id": user_id})
+    rank = rank_index.rank_of(user_id) if rank_index.ready else None
+    if rank is not None:
+        return rank
+    
+    # Fall back to a full count when the index can't answer
+    user = await db.users.find_one({"user_id": user_id}, projection(["game_stats.high_score"]))
     if not user:
         return 0
     
@@ -219,33 +480,3 @@ async def get_user_rank(user_id: str, db) -> int:
     })
     
     return higher_scores + 1
-
-async def generate_daily_challenges(user_id: str, db):
-    """Generate daily challenges for user"""
-    from models.game import DailyChallengeTemplate
-    from models.user import DailyChallenge
-    
-    # Sample challenge templates
-    templates = [
-        {"name": "Score Master", "type": "score", "target": 5000, "reward": 100},
-        {"name": "Survivor", "type": "survival", "target": 120, "reward": 75},
-        {"name": "Level Climber", "type": "level", "target": 10, "reward": 125},
-        {"name": "Enemy Hunter", "type": "enemies", "target": 50, "reward": 80}
-    ]
-    
-    # Generate 3 random challenges
-    import random
-    selected = random.sample(templates, 3)
-    
-    challenges = []
-    for template in selected:
-        challenge = DailyChallenge(
-            challenge_id=str(uuid.uuid4()),
-            challenge_type=template["type"],
-            target_value=template["target"],
-            reward_coins=template["reward"],
-            completed=False
-        )
-        challenges.append(challenge)
-    
-    return challenges
\ No newline at end of file
@@ -0,0 +1,9 @@
+# Daily challenge templates; each user gets DAILY_CHALLENGE_COUNT of these per UTC day
+CHALLENGE_TEMPLATES = [
+    {"name": "Score Master", "type": "score", "target": 5000, "reward": 100},
+    {"name": "Survivor", "type": "survival", "target": 120, "reward": 75},
+    {"name": "Level Climber", "type": "level", "target": 10, "reward": 125},
+    {"name": "Enemy Hunter", "type": "enemies", "target": 50, "reward": 80}
+]
+
+DAILY_CHALLENGE_COUNT = 3
@@ -1,7 +1,11 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+import logging
 import os
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
     database = None
@@ -11,6 +15,10 @@ db = Database()
 async def get_database():
     return db.database
 
+def projection(fields) -> dict:
+    """Projection returning only the given (dotted) fields"""
+    return {"_id": 0, **{field: 1 for field in fields}}
+
 async def connect_to_mongo():
     """Create database connection"""
     mongo_url = os.environ.get('MONGO_URL')
@@ -43,17 +51,130 @@ async def create_indexes():
     await db.database.leaderboard.create_index([("score", -1), ("timestamp", -1)])
     await db.database.leaderboard.create_index("user_id")
     await db.database.leaderboard.create_index("session_id")
+    await db.database.leaderboard.create_index("timestamp")
+    await db.database.leaderboard.create_index("compaction_batch", sparse=True)
+    await db.database.leaderboard_daily_summaries.create_index([("user_id", 1), ("day", 1)], unique=True)
+    await db.database.leaderboard_daily_summaries.create_index("day")
+    
+    # Best score per user, backing top-N leaderboard reads
+    await db.database.leaderboard_best.create_index("user_id", unique=True)
+    await db.database.leaderboard_best.create_index([("score", -1), ("timestamp", -1), ("user_id", -1)])
     
     # Purchase indexes
     await db.database.purchases.create_index("user_id")
     await db.database.purchases.create_index("purchase_date")
-    await db.database.purchases.create_index("transaction_id")
+    await ensure_unique_transaction_ids(db.database)
     
     # Analytics indexes
     await db.database.analytics.create_index([("timestamp", -1)])
     await db.database.analytics.create_index("user_id")
     await db.database.analytics.create_index("event_type")
     
+    # Daily, weekly and event leaderboards, expired once the window is over
+    await db.database.leaderboard_windows.create_index([("window", 1), ("user_id", 1)], unique=True)
+    await db.database.leaderboard_windows.create_index(
+        [("window", 1), ("score", -1), ("timestamp", -1), ("user_id", -1)]
+    )
+    await db.database.leaderboard_windows.create_index("expires_at", expireAfterSeconds=0)
+    
+    # Shared score buckets
+    await ensure_shared_score_buckets(db.database)
+    
+    # Event indexes, used when the in-memory events cache is unavailable
+    await db.database.events.create_index([("active", 1), ("start_date", 1), ("end_date", 1)])
+    
     # Ad interaction indexes
     await db.database.ads.create_index("user_id")
-    await db.database.ads.create_index("timestamp")
\ No newline at end of file
+    await db.database.ads.create_index("timestamp")
+
+async def ensure_unique_transaction_ids(database):
+    """Make store transaction IDs unique, the idempotency key for purchases.
+    
+    Before verification was idempotent every replay inserted another
+    record, so existing collections hold duplicates. Those are collapsed
+    to the first record once, before the unique index is built. If the
+    build still fails the non-unique index stays and startup goes on.
+    """
+    indexes = await database.purchases.index_information()
+    if not any(
+        index["key"] == [("transaction_id", 1)] and index.get("unique")
+        for index in indexes.values()
+    ):
+        await collapse_duplicate_transactions(database)
+        try:
+            await database.purchases.create_index(
+                "transaction_id",
+                name="transaction_id_unique",
+                unique=True,
+                partialFilterExpression={"transaction_id": {"$type": "string"}}
+            )
+        except PyMongoError:
+            logger.exception("Could not build the unique transaction_id index, purchase replays are only checked per user")
+            await database.purchases.create_index("transaction_id")
+            return
+    
+    # The unique index serves every lookup the old one did
+    if "transaction_id_1" in indexes and not indexes["transaction_id_1"].get("unique"):
+        await database.purchases.drop_index("transaction_id_1")
+
+async def collapse_duplicate_transactions(database):
+    """Delete all but the first record of each repeated transaction ID"""
+    # Records from before the granted flag existed were granted on insert
+    await database.purchases.update_many(
+        {"transaction_id": {"$type": "string"}, "granted": {"$exists": False}},
+        {"$set": {"granted": True}}
+    )
+    
+    duplicates = database.purchases.aggregate([
+        {"$match": {"transaction_id": {"$type": "string"}}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$transaction_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    
+    removed = 0
+    async for duplicate in duplicates:
+        result = await database.purchases.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
+        removed += result.deleted_count
+    if removed:
+        logger.info("Removed %d duplicate purchase records", removed)
+
+async def ensure_shared_score_buckets(database):
+    """Number buckets written before `seq` existed, then make it unique per user.
+    
+    Unnumbered buckets are older than every numbered one, so they are
+    numbered downwards from the user's lowest seq, newest first; a rerun
+    after an interrupted migration continues in the same order.
+    """
+    unnumbered = database.shared_scores.aggregate([
+        {"$match": {"seq": {"$exists": False}}},
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}}}
+    ], allowDiskUse=True)
+    
+    async for user in unnumbered:
+        lowest = await database.shared_scores.find_one(
+            {"user_id": user["_id"], "seq": {"$exists": True}},
+            {"seq": 1},
+            sort=[("seq", 1)]
+        )
+        seq = lowest["seq"] if lowest else 1
+        for bucket_id in user["ids"]:
+            seq -= 1
+            await database.shared_scores.update_one(
+                {"_id": bucket_id, "seq": {"$exists": False}},
+                {"$set": {"seq": seq}}
+            )
+    
+    try:
+        await database.shared_scores.create_index([("user_id", 1), ("seq", -1)], unique=True)
+    except PyMongoError:
+        logger.exception("Could not build the unique shared score bucket index")
+        await database.shared_scores.create_index([("user_id", 1), ("seq", -1)], name="user_id_1_seq_-1_lookup")
+        return
+    
+    # Buckets used to be found by count and paged by _id
+    indexes = await database.shared_scores.index_information()
+    for name in ("user_id_1_count_1", "user_id_1__id_-1"):
+        if name in indexes:
+            await database.shared_scores.drop_index(name)
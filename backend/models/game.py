@@ -46,10 +46,19 @@ class GameConfig(BaseModel):
     
     # Game balance
     base_coin_reward: int = 10
-    score_multiplier: float = 0.1
+    score_multiplier: float = 0.01
     level_completion_bonus: int = 50
     boss_defeat_bonus: int = 200
     
+    # Leaderboard snapshots
+    leaderboard_snapshot_size: int = 100
+    leaderboard_snapshot_seconds: int = 5
+    leaderboard_max_staleness_seconds: int = 15
+    
+    # Leaderboard retention: raw games are folded into daily summaries
+    leaderboard_history_days: int = 30
+    leaderboard_summary_days: int = 365
+    
     # Social features
     max_friends: int = 50
     share_score_coin_reward: int = 15
@@ -24,16 +24,23 @@ class SharedScore(BaseModel):
     platform: str
     timestamp: datetime
 
+class SharedScorePage(BaseModel):
+    scores: List[SharedScore]
+    next_cursor: Optional[str] = None
+
 class DailyChallenge(BaseModel):
     challenge_id: str
     challenge_type: str  # 'score', 'survival', 'level', 'enemies'
     target_value: int
     reward_coins: int
+    created_date: Optional[str] = None  # UTC day the challenge belongs to
+    progress: int = 0
     completed: bool = False
     completion_date: Optional[datetime] = None
 
 class Purchase(BaseModel):
     purchase_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
     item_type: str  # 'flutterer', 'skin', 'starter_pack', 'coins'
     item_id: str
     price_usd: float
@@ -59,18 +66,36 @@ class User(BaseModel):
     # Social Features
     daily_challenges: List[DailyChallenge] = []
     friends: List[str] = []
-    shared_scores: List[SharedScore] = []
+    shared_scores: List[SharedScore] = []  # Legacy, new shares live in the shared_scores collection
     
     # Monetization
     purchases: List[Purchase] = []
     ad_interactions: int = 0
     last_rewarded_ad: Optional[datetime] = None
+    rewarded_ads_date: Optional[str] = None  # UTC day the counter below belongs to
+    rewarded_ads_today: int = 0
     
     # Metadata
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_active: datetime = Field(default_factory=datetime.utcnow)
     app_version: str = "1.0.0"
     total_sessions: int = 0
+    revision: int = 0  # Incremented by every write, used by the user cache
+
+class UserProfile(BaseModel):
+    """User without the unbounded purchase, sharing and friend histories"""
+    user_id: str
+    username: str
+    platform: str
+    cosmic_coins: int = 0
+    selected_flutterer: str = 'basic_cosmic'
+    flutterer_progress: Dict[str, FluttererProgress] = {}
+    game_stats: GameStats = Field(default_factory=GameStats)
+    daily_challenges: List[DailyChallenge] = []
+    created_at: datetime
+    last_active: datetime
+    app_version: str = "1.0.0"
+    total_sessions: int = 0
 
 class UserCreate(BaseModel):
     username: str
@@ -100,4 +125,8 @@ class LeaderboardEntry(BaseModel):
     level: int
     flutterer_used: str
     timestamp: datetime
-    rank: int
\ No newline at end of file
+    rank: int
+
+class LeaderboardPage(BaseModel):
+    entries: List[LeaderboardEntry]
+    next_cursor: Optional[str] = None
@@ -1,28 +1,79 @@
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
 from pathlib import Path
 
 # Import database connection
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, db
+
+# Import background services
+from services.bus import DEFAULT_BUS, bus, create_bus, publish
+from services.compression import CompressionMiddleware
+from services.config import config_cache
+from services.events import events_cache
+from services.leaderboard import ensure_best_scores, friends_boards, leaderboard_snapshot
+from services.ranking import rank_index
+from services.ingest import analytics_buffer, ads_buffer
+from services.retention import compact_forever
+from services.user_cache import user_cache
 
 # Import API routers
 from api.users import router as users_router
 from api.game import router as game_router
+from api.session import router as session_router
 
 ROOT_DIR = Path(__file__).parent
 from dotenv import load_dotenv
 load_dotenv(ROOT_DIR / '.env')
 
+def create_cache_bus(database):
+    """Build the cross-worker invalidation bus and route messages to the caches"""
+    kind = os.environ.get('CACHE_BUS', DEFAULT_BUS)
+    if kind == "local" and int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        logger.warning("CACHE_BUS=local does not reach other workers, caches will only converge on their TTLs")
+    cache_bus = create_bus(kind, database, os.environ.get('CACHE_BUS_PATH'))
+    cache_bus.subscribe("user", user_cache.apply_invalidation)
+    cache_bus.subscribe("leaderboard", rank_index.apply_update)
+    cache_bus.subscribe("leaderboard", friends_boards.apply_update)
+    cache_bus.subscribe("config", lambda message: config_cache.reload_soon(database))
+    # Reloads triggered by these messages don't re-publish, see ConfigCache.on_change
+    config_cache.on_change(lambda config: publish("config", {}))
+    return cache_bus
+
 # Lifespan manager for database connections
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    bus.current = create_cache_bus(db.database)
+    await bus.current.start()
+    await config_cache.setup(db.database)
+    await events_cache.load(db.database)
+    await ensure_best_scores(db.database)
+    await rank_index.load(db.database)
+    analytics_buffer.start(db.database)
+    ads_buffer.start(db.database)
+    
+    background_tasks = [
+        asyncio.create_task(config_cache.refresh_forever(db.database)),
+        asyncio.create_task(events_cache.refresh_forever(db.database)),
+        asyncio.create_task(leaderboard_snapshot.refresh_forever(db.database)),
+        asyncio.create_task(compact_forever(db.database)),
+        asyncio.create_task(rank_index.reconcile_forever(
+            db.database, int(os.environ.get('RANK_RECONCILE_SECONDS', 300))
+        ))
+    ]
     yield
     # Shutdown
+    for task in background_tasks:
+        task.cancel()
+    await analytics_buffer.stop()
+    await ads_buffer.stop()
+    await bus.current.stop()
     await close_mongo_connection()
 
 # Create the main app
@@ -30,7 +81,8 @@ app = FastAPI(
     title="Butterfly Nebula Brawl API",
     description="Backend API for the mobile game Butterfly Nebula Brawl",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Create a router with the /api prefix
@@ -53,6 +105,7 @@ async def health_check():
 # Include feature routers
 api_router.include_router(users_router)
 api_router.include_router(game_router)
+api_router.include_router(session_router)
 
 # Include the main API router
 app.include_router(api_router)
@@ -66,6 +119,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses with brotli or gzip
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+# Sent by a UnixSocketBus worker when it starts listening
+JOIN_TOPIC = "bus.join"
+
+class InvalidationBus(ABC):
+    """Broadcasts cache invalidations from one worker to all the others.
+    
+    publish() never blocks the request: delivery is best effort, and every
+    cache on the receiving side also has a TTL or a periodic reload, so a
+    lost message only delays coherence. Handlers don't see messages
+    published by their own worker.
+    """
+    
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+    
+    def subscribe(self, topic: str, handler: Handler):
+        self._handlers[topic].append(handler)
+    
+    @abstractmethod
+    def publish(self, topic: str, payload: dict):
+        """Send a message to every other worker subscribed to `topic`"""
+    
+    async def start(self):
+        pass
+    
+    async def stop(self):
+        pass
+    
+    def _dispatch(self, topic: str, payload: dict):
+        for handler in self._handlers.get(topic, []):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("Bus handler for %s failed", topic)
+    
+    def _encode(self, topic: str, payload: dict) -> bytes:
+        return json.dumps({"origin": self.worker_id, "topic": topic, "payload": payload}).encode()
+    
+    def _receive(self, data: bytes):
+        message = json.loads(data)
+        if message["origin"] != self.worker_id:
+            self._dispatch(message["topic"], message["payload"])
+
+class LocalBus(InvalidationBus):
+    """In-process bus; buses sharing a hub behave like separate workers"""
+    
+    def __init__(self, hub: Optional[list] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+    
+    def publish(self, topic: str, payload: dict):
+        for bus in self.hub:
+            if bus is not self:
+                bus._dispatch(topic, payload)
+
+class UnixSocketBus(InvalidationBus):
+    """Single-host bus over Unix datagram sockets.
+    
+    Each worker binds one socket in a shared directory and publishes by
+    sending the message to every other socket found there. The directory
+    listing is cached; it is re-read when a worker announces itself, when
+    a send fails, and every `peer_ttl` seconds in case an announcement
+    was dropped.
+    """
+    
+    def __init__(self, directory: str, peer_ttl: float = 30):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}-{self.worker_id[:8]}.sock"
+        self.peer_ttl = peer_ttl
+        self._socket: Optional[socket.socket] = None
+        self._peers: Optional[List[Path]] = None
+        self._peers_at = 0.0
+        self.subscribe(JOIN_TOPIC, lambda payload: self._forget_peers())
+    
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(str(self.path))
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._on_readable)
+        # Workers already running have cached their peers without this one
+        self.publish(JOIN_TOPIC, {})
+    
+    async def stop(self):
+        if self._socket is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        self.path.unlink(missing_ok=True)
+    
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except BlockingIOError:
+                return
+            try:
+                self._receive(data)
+            except ValueError:
+                logger.warning("Dropping malformed bus message")
+    
+    def publish(self, topic: str, payload: dict):
+        if self._socket is None:
+            return
+        
+        data = self._encode(topic, payload)
+        for peer in self._current_peers():
+            try:
+                self._socket.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that owned this socket has exited
+                peer.unlink(missing_ok=True)
+                self._forget_peers()
+            except BlockingIOError:
+                logger.warning("Bus peer %s is backed up, dropping %s message", peer.name, topic)
+    
+    def _current_peers(self) -> List[Path]:
+        if self._peers is None or time.monotonic() - self._peers_at > self.peer_ttl:
+            self._peers = [peer for peer in self.directory.glob("*.sock") if peer != self.path]
+            self._peers_at = time.monotonic()
+        return self._peers
+    
+    def _forget_peers(self):
+        self._peers = None
+
+class ChangeStreamBus(InvalidationBus):
+    """Multi-host bus: messages are inserted into a MongoDB collection and
+    every worker follows it with a change stream (requires a replica set)."""
+    
+    def __init__(self, db, collection: str = "bus_messages"):
+        super().__init__()
+        self.collection = db[collection]
+        self._task: Optional[asyncio.Task] = None
+        self._pending = set()
+    
+    async def start(self):
+        # Messages only matter for a moment; let MongoDB expire them
+        await self.collection.create_index("created_at", expireAfterSeconds=300)
+        self._task = asyncio.create_task(self._follow())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _follow(self):
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "fullDocument.origin": {"$ne": self.worker_id}
+        }}]
+        while True:
+            try:
+                async with self.collection.watch(pipeline) as stream:
+                    async for change in stream:
+                        document = change["fullDocument"]
+                        self._dispatch(document["topic"], document["payload"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Bus change stream failed, reconnecting")
+                await asyncio.sleep(1)
+    
+    def publish(self, topic: str, payload: dict):
+        task = asyncio.create_task(self.collection.insert_one({
+            "origin": self.worker_id,
+            "topic": topic,
+            "payload": payload,
+            "created_at": datetime.utcnow()
+        }))
+        # Keep a reference until the insert finishes
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+# Unix sockets keep every worker on a host coherent; a LocalBus only
+# reaches buses in its own process
+DEFAULT_BUS = "unix" if os.name == "posix" else "local"
+
+def create_bus(kind: str, db=None, path: Optional[str] = None) -> InvalidationBus:
+    """Build the bus selected by CACHE_BUS: local, unix or mongo"""
+    if kind == "unix":
+        return UnixSocketBus(path or "/tmp/butterfly-nebula-bus")
+    if kind == "mongo":
+        return ChangeStreamBus(db)
+    if kind == "local":
+        return LocalBus()
+    raise ValueError(f"Unknown cache bus: {kind}")
+
+class Bus:
+    current: InvalidationBus = LocalBus()
+
+bus = Bus()
+
+def publish(topic: str, payload: dict):
+    """Publish on the bus the app was started with"""
+    bus.current.publish(topic, payload)
@@ -0,0 +1,154 @@
+import random
+from datetime import datetime
+from functools import lru_cache
+from typing import List
+
+from data.challenges import CHALLENGE_TEMPLATES, DAILY_CHALLENGE_COUNT
+from models.user import DailyChallenge
+
+@lru_cache(maxsize=10000)
+def challenge_set(user_id: str, day: str) -> tuple:
+    """The user's challenge templates for a UTC day.
+    
+    Seeded by day and user, so every worker picks the same set without
+    storing it, and the set only has to be computed once per day.
+    """
+    rng = random.Random(f"{day}:{user_id}")
+    return tuple(rng.sample(CHALLENGE_TEMPLATES, DAILY_CHALLENGE_COUNT))
+
+def todays_challenges(user: dict, now: datetime) -> List[DailyChallenge]:
+    """Today's challenges with any progress stored on the user applied"""
+    day = now.date().isoformat()
+    stored = {
+        challenge["challenge_id"]: challenge
+        for challenge in user.get("daily_challenges", [])
+        if challenge.get("created_date") == day
+    }
+    
+    challenges = []
+    for template in challenge_set(user["user_id"], day):
+        challenge_id = f"{day}:{template['type']}"
+        progress = stored.get(challenge_id, {})
+        challenges.append(DailyChallenge(
+            challenge_id=challenge_id,
+            challenge_type=template["type"],
+            target_value=template["target"],
+            reward_coins=template["reward"],
+            created_date=day,
+            progress=progress.get("progress", 0),
+            completed=progress.get("completed", False),
+            completion_date=progress.get("completion_date")
+        ))
+    return challenges
+
+# How a batch of runs advances each challenge type: score and level count
+# the best run of the day, survival and enemies accumulate across runs
+CHALLENGE_METRICS = {
+    "score": ("max", lambda score_data: score_data.score),
+    "level": ("max", lambda score_data: score_data.level),
+    "survival": ("sum", lambda score_data: score_data.survival_time),
+    "enemies": ("sum", lambda score_data: score_data.enemies_defeated)
+}
+
+def batch_progress(challenge_type: str, scores) -> tuple:
+    """How a challenge type combines, and what the batch contributes to it"""
+    combine, metric = CHALLENGE_METRICS[challenge_type]
+    values = [metric(score_data) for score_data in scores]
+    return combine, max(values) if combine == "max" else sum(values)
+
+def evaluate_challenges(user: dict, scores, now: datetime) -> List[DailyChallenge]:
+    """Today's challenges the runs complete, given the user before the update.
+    
+    Python mirror of challenge_progress_stage, for the response.
+    """
+    completed = []
+    
+    for challenge in todays_challenges(user, now):
+        combine, value = batch_progress(challenge.challenge_type, scores)
+        challenge.progress = max(challenge.progress, value) if combine == "max" else challenge.progress + value
+        
+        if not challenge.completed and challenge.progress >= challenge.target_value:
+            challenge.completed = True
+            challenge.completion_date = now
+            completed.append(challenge)
+    
+    return completed
+
+def challenge_progress_stage(user_id: str, scores, now: datetime) -> dict:
+    """Pipeline stage replacing daily_challenges with today's, advanced by the runs.
+    
+    The runs' contribution to each of today's challenges is computed up
+    front and checked against every target in a single $map. Challenges
+    from earlier days drop out. Each entry carries a temporary `_rewarded`
+    flag set when this update completed it; the caller adds
+    CHALLENGE_REWARD_EXPRESSION to the coins and removes the flag afterwards.
+    """
+    day = now.date().isoformat()
+    targets = []
+    for template in challenge_set(user_id, day):
+        combine, value = batch_progress(template["type"], scores)
+        targets.append({
+            "challenge_id": f"{day}:{template['type']}",
+            "challenge_type": template["type"],
+            "target_value": template["target"],
+            "reward_coins": template["reward"],
+            "value": value,
+            "cumulative": combine == "sum"
+        })
+    
+    stored_progress = {"$ifNull": ["$$stored.progress", 0]}
+    stored_completed = {"$ifNull": ["$$stored.completed", False]}
+    
+    return {"$set": {"daily_challenges": {"$map": {
+        "input": {"$literal": targets},
+        "as": "target",
+        "in": {"$let": {
+            "vars": {"stored": {"$ifNull": [
+                {"$arrayElemAt": [
+                    {"$filter": {
+                        "input": {"$ifNull": ["$daily_challenges", []]},
+                        "as": "challenge",
+                        "cond": {"$eq": ["$$challenge.challenge_id", "$$target.challenge_id"]}
+                    }},
+                    0
+                ]},
+                {}
+            ]}},
+            "in": {"$let": {
+                "vars": {"progress": {"$cond": [
+                    "$$target.cumulative",
+                    {"$add": [stored_progress, "$$target.value"]},
+                    {"$max": [stored_progress, "$$target.value"]}
+                ]}},
+                "in": {"$let": {
+                    "vars": {"rewarded": {"$and": [
+                        {"$ne": [stored_completed, True]},
+                        {"$gte": ["$$progress", "$$target.target_value"]}
+                    ]}},
+                    "in": {
+                        "challenge_id": "$$target.challenge_id",
+                        "challenge_type": "$$target.challenge_type",
+                        "target_value": "$$target.target_value",
+                        "reward_coins": "$$target.reward_coins",
+                        "created_date": day,
+                        "progress": "$$progress",
+                        "completed": {"$or": [{"$eq": [stored_completed, True]}, "$$rewarded"]},
+                        "completion_date": {"$cond": [
+                            "$$rewarded", now, {"$ifNull": ["$$stored.completion_date", None]}
+                        ]},
+                        "_rewarded": "$$rewarded"
+                    }
+                }}
+            }}
+        }}
+    }}}}
+
+# Coins for the challenges challenge_progress_stage just completed. It
+# always writes DAILY_CHALLENGE_COUNT entries, so they are added by position
+CHALLENGE_REWARD_EXPRESSION = {"$add": [
+    {"$let": {
+        "vars": {"challenge": {"$arrayElemAt": ["$daily_challenges", position]}},
+        "in": {"$cond": ["$$challenge._rewarded", "$$challenge.reward_coins", 0]}
+    }}
+    for position in range(DAILY_CHALLENGE_COUNT)
+]}
@@ -0,0 +1,109 @@
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts, preferring brotli over gzip"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        # Quality 4 compresses better than gzip at comparable speed
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=6)
+
+def weaken_etag(etag: bytes) -> bytes:
+    """A strong ETag only describes the identity body, not a compressed one"""
+    return etag if etag.startswith(b"W/") else b"W/" + etag
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip when the client accepts it.
+    
+    Bodies below `minimum_size` are sent as-is, since the compressed
+    framing would cost more than it saves. Responses that already set a
+    Content-Encoding are passed through untouched. Compressed responses
+    get a weak ETag, which If-None-Match still matches.
+    """
+    
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+    
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+    
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+    
+        start = None
+        chunks = []
+    
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+    
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+    
+            body = b"".join(chunks)
+            headers = [
+                (name, value) for name, value in start["headers"]
+                if name not in (b"content-length", b"vary")
+            ]
+            vary = [value for name, value in start["headers"] if name == b"vary"]
+            already_encoded = any(name == b"content-encoding" for name, _ in start["headers"])
+    
+            if len(body) >= self.minimum_size and not already_encoded:
+                body = compress(body, encoding)
+                headers = [
+                    (name, weaken_etag(value) if name == b"etag" else value)
+                    for name, value in headers
+                ]
+                headers.append((b"content-encoding", encoding.encode()))
+                vary.append(b"Accept-Encoding")
+    
+            if vary:
+                headers.append((b"vary", b", ".join(vary)))
+            headers.append((b"content-length", str(len(body)).encode()))
+    
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+    
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+from models.game import GameConfig
+
+logger = logging.getLogger(__name__)
+
+# Baseline deployments stored score_multiplier 0.1 while the score handler
+# hard-coded 0.01; this migration moves stored configs to what was paid out
+SCORE_MULTIPLIER_MIGRATION = "score_multiplier_0.01"
+
+class ConfigCache:
+    """In-process GameConfig with a TTL and explicit invalidation.
+    
+    Handlers read the cached config synchronously through get(). The
+    background refresher follows game_config through a change stream when
+    the deployment supports one and falls back to polling every TTL. While
+    the change stream is open the cache never goes stale on its own.
+    """
+    
+    def __init__(self, version: str = "1.0.0", ttl_seconds: float = 60):
+        self.version = version
+        self.ttl_seconds = ttl_seconds
+        self._config = GameConfig(version=version)
+        self._loaded_at: Optional[float] = None
+        self._watching = False
+        self._listeners: List[Callable[[GameConfig], None]] = []
+        self._reload: Optional[asyncio.Task] = None
+    
+    def get(self) -> GameConfig:
+        """Cached config, or the defaults if it has never been loaded"""
+        return self._config
+    
+    def is_stale(self) -> bool:
+        if self._watching:
+            return False
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+    
+    def invalidate(self):
+        """Force the next current() call to reload from MongoDB"""
+        self._loaded_at = None
+    
+    def on_change(self, callback: Callable[[GameConfig], None]):
+        """Register a callback run when this worker notices a config change.
+        
+        Changes seen through the change stream or learned from another
+        worker don't run callbacks, since every worker gets those directly.
+        """
+        self._listeners.append(callback)
+    
+    def reload_soon(self, db):
+        """Reload in the background because another worker saw a change"""
+        self._start_reload(db, notify=False)
+    
+    async def current(self, db) -> GameConfig:
+        """Cached config, reloading first if the TTL has expired"""
+        if self.is_stale():
+            await asyncio.shield(self._start_reload(db))
+        return self._config
+    
+    def _start_reload(self, db, notify: bool = True) -> asyncio.Task:
+        # One reload per worker at a time; _reload also keeps the task alive
+        if self._reload is None or self._reload.done():
+            self._reload = asyncio.create_task(self.load(db, notify))
+        return self._reload
+    
+    async def setup(self, db):
+        """Create and migrate the stored config, then load it; run once at startup"""
+        # A single upsert so concurrent first starts can't insert duplicates
+        await db.game_config.update_one(
+            {"version": self.version},
+            {"$setOnInsert": {
+                **GameConfig(version=self.version).dict(),
+                "migrations": [SCORE_MULTIPLIER_MIGRATION]
+            }},
+            upsert=True
+        )
+        await db.game_config.update_one(
+            {"version": self.version, "score_multiplier": 0.1, "migrations": {"$ne": SCORE_MULTIPLIER_MIGRATION}},
+            {"$set": {"score_multiplier": 0.01}}
+        )
+        await db.game_config.update_one(
+            {"version": self.version, "migrations": {"$ne": SCORE_MULTIPLIER_MIGRATION}},
+            {"$addToSet": {"migrations": SCORE_MULTIPLIER_MIGRATION}}
+        )
+        await self.load(db)
+    
+    async def load(self, db, notify: bool = True):
+        """Read the stored config, keeping the defaults if there is none"""
+        document = await db.game_config.find_one({"version": self.version}, {"_id": 0, "migrations": 0})
+        self._set(GameConfig(**document) if document else GameConfig(version=self.version), notify)
+    
+    def _set(self, config: GameConfig, notify: bool):
+        changed = config != self._config
+        self._config = config
+        self._loaded_at = time.monotonic()
+        
+        if changed and notify:
+            for callback in self._listeners:
+                try:
+                    callback(config)
+                except Exception:
+                    logger.exception("GameConfig change listener failed")
+    
+    async def refresh_forever(self, db):
+        """Keep the cache in sync via a change stream, or by polling"""
+        try:
+            async with db.game_config.watch() as stream:
+                # Re-read once the stream is open, in case of a change in between
+                await self.load(db, notify=False)
+                self._watching = True
+                async for _ in stream:
+                    await self.load(db, notify=False)
+        except Exception as e:
+            # Change streams need a replica set; standalone servers get polling
+            logger.info("GameConfig change stream unavailable (%s), polling every %ss", e, self.ttl_seconds)
+        finally:
+            self._watching = False
+        
+        while True:
+            await asyncio.sleep(self.ttl_seconds)
+            try:
+                await self.load(db)
+            except Exception:
+                logger.exception("GameConfig refresh failed")
+
+config_cache = ConfigCache()
@@ -0,0 +1,97 @@
+import asyncio
+import bisect
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from models.game import Event
+
+logger = logging.getLogger(__name__)
+
+# end_date is inclusive, so an event stops being active just after it
+END_RESOLUTION = timedelta(microseconds=1)
+
+class EventsCache:
+    """In-memory index of upcoming and running events.
+    
+    Events are kept sorted by start_date so "active at time t" is a bisect
+    plus a scan of the events already started. The answer is memoized
+    until the next start or end boundary, when it is recomputed.
+    """
+    
+    def __init__(self, refresh_seconds: float = 60):
+        self.refresh_seconds = refresh_seconds
+        self._events: List[Event] = []
+        self._starts: List[datetime] = []
+        self._loaded_at: Optional[float] = None
+        self._reset_window()
+    
+    def _reset_window(self):
+        self._active: List[Event] = []
+        self._valid_from: Optional[datetime] = None
+        self._valid_until: Optional[datetime] = None
+    
+    @property
+    def ready(self) -> bool:
+        """Loaded recently enough to answer without querying MongoDB"""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < 2 * self.refresh_seconds
+    
+    def invalidate(self):
+        """Drop the index so reads fall back to MongoDB until the next load"""
+        self._loaded_at = None
+    
+    async def load(self, db):
+        """Load every enabled event that hasn't ended yet"""
+        documents = await db.events.find({
+            "active": True,
+            "end_date": {"$gte": datetime.utcnow()}
+        }).sort("start_date", 1).to_list(None)
+        
+        events = [Event(**document) for document in documents]
+        self._events = events
+        self._starts = [event.start_date for event in events]
+        self._reset_window()
+        self._loaded_at = time.monotonic()
+    
+    def active_at(self, when: datetime) -> List[Event]:
+        """Events running at `when`"""
+        if self._valid_from is not None and self._valid_from <= when < self._valid_until:
+            return self._active
+        
+        started = bisect.bisect_right(self._starts, when)
+        active = [event for event in self._events[:started] if event.end_date >= when]
+        
+        # The answer holds until the next event starts or a running one ends
+        boundaries = [event.end_date + END_RESOLUTION for event in active]
+        if started < len(self._starts):
+            boundaries.append(self._starts[started])
+        
+        self._active = active
+        self._valid_from = when
+        self._valid_until = min(boundaries, default=datetime.max)
+        return active
+    
+    async def active_events(self, db, when: datetime) -> List[Event]:
+        """Events running at `when`, from MongoDB if the index isn't ready"""
+        if self.ready:
+            return self.active_at(when)
+        
+        logger.warning("Events cache not ready, querying active events from MongoDB")
+        documents = await db.events.find({
+            "active": True,
+            "start_date": {"$lte": when},
+            "end_date": {"$gte": when}
+        }).to_list(100)
+        return [Event(**document) for document in documents]
+    
+    async def refresh_forever(self, db):
+        """Periodically reload to pick up new or edited events"""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.load(db)
+            except Exception:
+                logger.exception("Events cache refresh failed")
+
+events_cache = EventsCache()
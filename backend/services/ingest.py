@@ -0,0 +1,169 @@
+import asyncio
+import codecs
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class BufferFull(Exception):
+    """Raised when the ingest queue stays full past the put timeout"""
+
+class BufferedInserter:
+    """Queue documents in-process and write them to a collection in bulk.
+    
+    A background task flushes with insert_many once `batch_size` documents
+    are waiting or `flush_interval` seconds have passed since the first one
+    arrived, whichever comes first.
+    """
+    
+    def __init__(
+        self,
+        collection: str,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        put_timeout: float = 0.05
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._db = None
+    
+    def start(self, db):
+        """Start the flush task on the running event loop"""
+        self._db = db
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Flush everything queued so far and stop the flush task"""
+        if self._task is None:
+            return
+        
+        # The sentinel queues behind pending documents, so they all get written
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+    
+    async def put(self, document: dict):
+        """Queue a document, waiting briefly for room before giving up"""
+        if self._task is None:
+            raise BufferFull(f"{self.collection} buffer is not running")
+        
+        try:
+            await asyncio.wait_for(self._queue.put(document), self.put_timeout)
+        except asyncio.TimeoutError:
+            raise BufferFull(f"{self.collection} buffer is full")
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            document = await self._queue.get()
+            if document is None:
+                return
+            
+            batch = [document]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    document = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if document is None:
+                    stopping = True
+                    break
+                batch.append(document)
+            
+            await self._flush(batch)
+            if stopping:
+                return
+    
+    async def _flush(self, batch: list):
+        try:
+            await self._db[self.collection].insert_many(batch, ordered=False)
+        except Exception:
+            logger.exception("Failed to write %d %s documents", len(batch), self.collection)
+
+async def iter_json_documents(
+    chunks: AsyncIterator[bytes],
+    max_document_size: int = 64 * 1024
+) -> AsyncIterator[dict]:
+    """Decode JSON objects from a streamed body as they arrive.
+    
+    Accepts either a JSON array of objects or newline-delimited JSON. Only
+    the current, not yet complete, object is ever held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    in_array = None
+    closed = False
+    # Inside an array: whether the last token was an element or a comma
+    after_element = False
+    after_comma = False
+    
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        pos = 0
+        
+        while not closed:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos >= len(buffer):
+                break
+            
+            if in_array is None:
+                in_array = buffer[pos] == "["
+                if in_array:
+                    pos += 1
+                    continue
+            
+            if in_array:
+                if buffer[pos] == "]" and not after_comma:
+                    closed = True
+                    pos += 1
+                    break
+                if buffer[pos] == "," and after_element:
+                    after_element, after_comma = False, True
+                    pos += 1
+                    continue
+                if after_element:
+                    raise ValueError(f"Expected ',' or ']' after array element, got {buffer[pos]!r}")
+            
+            if buffer[pos] != "{":
+                raise ValueError(f"Expected a JSON object, got {buffer[pos]!r}")
+            
+            try:
+                document, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete object, wait for the next chunk
+                break
+            
+            after_element, after_comma = True, False
+            yield document
+        
+        buffer = buffer[pos:]
+        if closed and buffer.strip():
+            raise ValueError("Unexpected data after JSON array")
+        if len(buffer) > max_document_size:
+            raise ValueError(f"JSON object exceeds {max_document_size} bytes")
+    
+    buffer += utf8.decode(b"", final=True)
+    if buffer.strip():
+        raise ValueError("Malformed or truncated JSON body")
+    if in_array and not closed:
+        raise ValueError("Unterminated JSON array")
+
+analytics_buffer = BufferedInserter("analytics")
+ads_buffer = BufferedInserter("ads")
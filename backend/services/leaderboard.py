@@ -0,0 +1,332 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from fastapi import Request, Response
+
+from models.user import LeaderboardEntry
+from services.config import config_cache
+from services.events import events_cache
+from services.ranking import rank_index
+from services.responses import PrerenderedJSON
+
+logger = logging.getLogger(__name__)
+
+# One document per user holding the run that produced their best score.
+# Kept up to date by submit_score so leaderboard reads never touch the
+# full game history in the `leaderboard` collection. user_id breaks ties
+# so every entry has a unique position for keyset pagination.
+BEST_SCORE_SORT = [("score", -1), ("timestamp", -1), ("user_id", -1)]
+REVERSE_BEST_SCORE_SORT = [(field, -direction) for field, direction in BEST_SCORE_SORT]
+
+async def record_best_score(db, entry: dict) -> bool:
+    """Store a run as the user's best if it beats their current best score"""
+    entry = {k: v for k, v in entry.items() if k != "_id"}
+    
+    try:
+        result = await db.leaderboard_best.update_one(
+            {"user_id": entry["user_id"], "score": {"$lt": entry["score"]}},
+            {"$set": entry},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The user already holds an equal or better score
+        return False
+    
+    return result.upserted_id is not None or result.modified_count > 0
+
+async def get_top_scores(db, limit: int) -> list:
+    """Get the top N best scores, one per user"""
+    cursor = db.leaderboard_best.find({}, {"_id": 0}).sort(BEST_SCORE_SORT).limit(limit)
+    return await cursor.to_list(limit)
+
+def encode_cursor(entry: dict, rank: int) -> str:
+    """Opaque cursor pointing just after `entry`"""
+    position = [entry["score"], entry["timestamp"].isoformat(), entry["user_id"], rank]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[int, datetime, str, int]:
+    try:
+        score, timestamp, user_id, rank = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(score), datetime.fromisoformat(timestamp), str(user_id), int(rank)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def ranked_below(score: int, timestamp: datetime, user_id: str) -> dict:
+    """Filter for entries positioned after the given one"""
+    return {"$or": [
+        {"score": {"$lt": score}},
+        {"score": score, "timestamp": {"$lt": timestamp}},
+        {"score": score, "timestamp": timestamp, "user_id": {"$lt": user_id}}
+    ]}
+
+def ranked_above(score: int, timestamp: datetime, user_id: str) -> dict:
+    """Filter for entries positioned before the given one"""
+    return {"$or": [
+        {"score": {"$gt": score}},
+        {"score": score, "timestamp": {"$gt": timestamp}},
+        {"score": score, "timestamp": timestamp, "user_id": {"$gt": user_id}}
+    ]}
+
+def add_ranks(entries: List[dict], first_rank: int) -> List[dict]:
+    for i, entry in enumerate(entries):
+        entry["rank"] = first_rank + i
+    return entries
+
+async def get_scores_page(
+    db,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """A page of best scores seeking past `cursor`, plus the next cursor"""
+    query, first_rank = {}, 1
+    if cursor:
+        score, timestamp, user_id, rank = decode_cursor(cursor)
+        query, first_rank = ranked_below(score, timestamp, user_id), rank + 1
+    
+    cursor = db.leaderboard_best.find(query, {"_id": 0}).sort(BEST_SCORE_SORT).limit(limit + 1)
+    entries = await cursor.to_list(limit + 1)
+    add_ranks(entries, first_rank)
+    
+    if len(entries) <= limit:
+        return entries, None
+    return entries[:limit], encode_cursor(entries[limit - 1], entries[limit - 1]["rank"])
+
+async def get_scores_around(db, user_id: str, count: int) -> List[dict]:
+    """The user's best score with up to `count` entries above and below it"""
+    me = await db.leaderboard_best.find_one({"user_id": user_id}, {"_id": 0})
+    if not me:
+        return []
+    
+    position = (me["score"], me["timestamp"], me["user_id"])
+    above = db.leaderboard_best.find(ranked_above(*position), {"_id": 0})
+    above = await above.sort(REVERSE_BEST_SCORE_SORT).limit(count).to_list(count)
+    below = db.leaderboard_best.find(ranked_below(*position), {"_id": 0})
+    below = await below.sort(BEST_SCORE_SORT).limit(count).to_list(count)
+    
+    # Users with a strictly higher score come from the rank index; only ties
+    # with the user's score need counting
+    if rank_index.ready:
+        ahead = rank_index.count_above(me["score"]) + await db.leaderboard_best.count_documents({
+            "score": me["score"], **ranked_above(*position)
+        })
+    else:
+        ahead = await db.leaderboard_best.count_documents(ranked_above(*position))
+    
+    return add_ranks(above[::-1] + [me] + below, ahead + 1 - len(above))
+
+# How long a finished window stays readable before its TTL index drops it
+WINDOW_RETENTION = {
+    "daily": timedelta(days=2),
+    "weekly": timedelta(days=7),
+    "event": timedelta(days=7)
+}
+
+def window_key(period: str, when: datetime, event_id: Optional[str] = None) -> str:
+    """Key of the daily, weekly or event window a time falls in"""
+    if period == "daily":
+        return f"daily:{when.date().isoformat()}"
+    if period == "weekly":
+        year, week, _ = when.isocalendar()
+        return f"weekly:{year}-W{week:02d}"
+    if period == "event":
+        return f"event:{event_id}"
+    raise ValueError(f"Unknown leaderboard period: {period}")
+
+async def current_windows(db, now: datetime) -> List[Tuple[str, datetime]]:
+    """(key, expires_at) of every window a score submitted now counts towards"""
+    day_start = datetime(now.year, now.month, now.day)
+    day_end = day_start + timedelta(days=1)
+    week_end = day_start + timedelta(days=7 - now.weekday())
+    
+    windows = [
+        (window_key("daily", now), day_end + WINDOW_RETENTION["daily"]),
+        (window_key("weekly", now), week_end + WINDOW_RETENTION["weekly"])
+    ]
+    for event in await events_cache.active_events(db, now):
+        expires_at = event.end_date + WINDOW_RETENTION["event"]
+        windows.append((window_key("event", now, event.event_id), expires_at))
+    return windows
+
+async def record_windowed_scores(db, entry: dict, now: datetime):
+    """Keep the run as the user's best in each window that is open now.
+    
+    Windows are assigned by submission time, not the client's timestamp.
+    """
+    entry = {k: v for k, v in entry.items() if k != "_id"}
+    operations = [
+        UpdateOne(
+            {"window": window, "user_id": entry["user_id"], "score": {"$lt": entry["score"]}},
+            {"$set": {**entry, "window": window, "expires_at": expires_at}},
+            upsert=True
+        )
+        for window, expires_at in await current_windows(db, now)
+    ]
+    
+    try:
+        await db.leaderboard_windows.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate keys mean the user already holds a better score there
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+async def get_window_scores(db, window: str, limit: int) -> List[dict]:
+    """Top N of a single window, read through the (window, score) index"""
+    cursor = db.leaderboard_windows.find({"window": window}, {"_id": 0, "window": 0, "expires_at": 0})
+    entries = await cursor.sort(BEST_SCORE_SORT).limit(limit).to_list(limit)
+    return add_ranks(entries, 1)
+
+async def get_friends_scores(db, user_id: str, friends: List[str]) -> List[dict]:
+    """Best scores of the user and their friends, ranked among themselves"""
+    members = list(dict.fromkeys([user_id, *friends]))
+    cursor = db.leaderboard_best.find({"user_id": {"$in": members}}, {"_id": 0}).sort(BEST_SCORE_SORT)
+    entries = await cursor.to_list(len(members))
+    return add_ranks(entries, 1)
+
+class FriendsBoardCache:
+    """Per-user friends leaderboards.
+    
+    A reverse index from each member to the boards they appear on lets a
+    new best score drop exactly the boards it changes.
+    """
+    
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # viewer user_id -> (expires_at, members, entries)
+        self._boards: "OrderedDict[str, tuple]" = OrderedDict()
+        self._viewers: Dict[str, Set[str]] = {}
+    
+    def get(self, user_id: str) -> Optional[List[dict]]:
+        board = self._boards.get(user_id)
+        if board is None:
+            return None
+        if time.monotonic() >= board[0]:
+            self._drop(user_id)
+            return None
+        self._boards.move_to_end(user_id)
+        return board[2]
+    
+    def put(self, user_id: str, members: List[str], entries: List[dict]):
+        self._drop(user_id)
+        self._boards[user_id] = (time.monotonic() + self.ttl_seconds, members, entries)
+        for member in members:
+            self._viewers.setdefault(member, set()).add(user_id)
+        
+        while len(self._boards) > self.max_size:
+            self._drop(next(iter(self._boards)))
+    
+    def member_improved(self, member_id: str):
+        """Drop every board the member appears on"""
+        for viewer in list(self._viewers.get(member_id, ())):
+            self._drop(viewer)
+    
+    def apply_update(self, message: dict):
+        """Apply a new high score broadcast by another worker"""
+        self.member_improved(message["user_id"])
+    
+    def _drop(self, user_id: str):
+        board = self._boards.pop(user_id, None)
+        if board is None:
+            return
+        for member in board[1]:
+            viewers = self._viewers.get(member)
+            if viewers is not None:
+                viewers.discard(user_id)
+                if not viewers:
+                    del self._viewers[member]
+
+friends_boards = FriendsBoardCache()
+
+class LeaderboardSnapshot:
+    """Top-N global leaderboard precomputed in the background.
+    
+    Each refresh replaces the ranked entries; the JSON bytes for a given
+    `limit` are rendered on first use and reused until the next refresh.
+    """
+    
+    def __init__(self):
+        self._entries: List[dict] = []
+        self._rendered: Dict[int, PrerenderedJSON] = {}
+        self._taken_at: Optional[float] = None
+    
+    async def refresh(self, db, size: int):
+        entries = add_ranks(await get_top_scores(db, size), 1)
+        self._entries = [LeaderboardEntry(**entry).dict() for entry in entries]
+        self._rendered = {}
+        self._taken_at = time.monotonic()
+    
+    def top(self, limit: int) -> Optional[PrerenderedJSON]:
+        """The rendered top `limit`, or None if the snapshot can't serve it"""
+        config = config_cache.get()
+        if self._taken_at is None or limit > config.leaderboard_snapshot_size:
+            return None
+        if time.monotonic() - self._taken_at > config.leaderboard_max_staleness_seconds:
+            return None
+        
+        rendered = self._rendered.get(limit)
+        if rendered is None:
+            rendered = PrerenderedJSON(self._entries[:limit], max_age=config.leaderboard_snapshot_seconds)
+            self._rendered[limit] = rendered
+        return rendered
+    
+    def response(self, request: Request, limit: int) -> Optional[Response]:
+        """Serve the top `limit` from memory, or None if the snapshot can't"""
+        rendered = self.top(limit)
+        return rendered.response(request) if rendered else None
+    
+    async def refresh_forever(self, db):
+        """Re-take the snapshot every GameConfig.leaderboard_snapshot_seconds"""
+        while True:
+            config = config_cache.get()
+            try:
+                await self.refresh(db, config.leaderboard_snapshot_size)
+            except Exception:
+                logger.exception("Leaderboard snapshot failed")
+            await asyncio.sleep(config.leaderboard_snapshot_seconds)
+
+leaderboard_snapshot = LeaderboardSnapshot()
+
+async def rebuild_best_scores(db):
+    """Backfill the best-score collection from the full leaderboard history"""
+    pipeline = [
+        {"$sort": {"user_id": 1, "score": -1, "timestamp": -1}},
+        {"$group": {
+            "_id": "$user_id",
+            "username": {"$first": "$username"},
+            "score": {"$first": "$score"},
+            "level": {"$first": "$level"},
+            "flutterer_used": {"$first": "$flutterer_used"},
+            "timestamp": {"$first": "$timestamp"},
+            "session_id": {"$first": "$session_id"}
+        }},
+        {"$addFields": {"user_id": "$_id"}},
+        {"$project": {"_id": 0}},
+        {"$merge": {
+            "into": "leaderboard_best",
+            "on": "user_id",
+            "whenMatched": "keepExisting",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    
+    await db.leaderboard.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+async def ensure_best_scores(db):
+    """Backfill best scores on first start against an existing leaderboard"""
+    if db is None:
+        return
+    
+    if await db.leaderboard_best.estimated_document_count() > 0:
+        return
+    
+    if await db.leaderboard.estimated_document_count() > 0:
+        await rebuild_best_scores(db)
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from data.flutterers import STARTER_PACK
+
+COIN_PACKS = {"small": 500, "medium": 1200, "large": 2500}
+
+# Transaction IDs kept on the user to make grants idempotent; the full
+# records live in the purchases collection
+MAX_GRANTED_TRANSACTIONS = 50
+
+class RecentTransactions:
+    """LRU of transaction IDs this worker has already granted.
+    
+    Clients retry purchase verification aggressively when a store is
+    having trouble, so replays are answered from memory before touching
+    the database. A miss is still safe: the database checks are the
+    source of truth.
+    """
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    def get(self, transaction_id: str) -> Optional[tuple]:
+        """The (user_id, purchase_id) a transaction was granted to, if seen"""
+        entry = self._entries.get(transaction_id)
+        if entry is not None:
+            self._entries.move_to_end(transaction_id)
+        return entry
+    
+    def add(self, transaction_id: str, user_id: str, purchase_id: str):
+        self._entries[transaction_id] = (user_id, purchase_id)
+        self._entries.move_to_end(transaction_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+def unlock_flutterer(update: dict, flutterer_id: str, now: datetime):
+    update["$set"][f"flutterer_progress.{flutterer_id}"] = {
+        "flutterer_id": flutterer_id,
+        "unlocked": True,
+        "purchase_date": now,
+        "usage_count": 0
+    }
+
+def purchase_update(purchase: dict, now: datetime) -> dict:
+    """One user update that grants a purchase and remembers its transaction"""
+    update = {
+        "$set": {},
+        "$inc": {"revision": 1},
+        "$push": {"granted_transactions": {
+            "$each": [purchase["transaction_id"]],
+            "$slice": -MAX_GRANTED_TRANSACTIONS
+        }}
+    }
+    
+    if purchase["item_type"] == "flutterer":
+        unlock_flutterer(update, purchase["item_id"], now)
+    
+    elif purchase["item_type"] == "starter_pack":
+        for item in STARTER_PACK["contents"]:
+            if item["type"] == "flutterer":
+                unlock_flutterer(update, item["id"], now)
+            elif item["type"] == "coins":
+                update["$inc"]["cosmic_coins"] = update["$inc"].get("cosmic_coins", 0) + item["amount"]
+    
+    elif purchase["item_type"] == "coins":
+        update["$inc"]["cosmic_coins"] = COIN_PACKS.get(purchase["item_id"], 500)
+    
+    if not update["$set"]:
+        del update["$set"]
+    return update
+
+recent_transactions = RecentTransactions()
@@ -0,0 +1,137 @@
+import asyncio
+import bisect
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class RankIndex:
+    """In-process order-statistics index over user high scores.
+    
+    Scores are grouped into fixed-width buckets. A Fenwick tree over bucket
+    counts answers "how many scores fall below this bucket" in O(log n) and
+    a sorted list per bucket resolves the exact position inside it.
+    """
+    
+    def __init__(self, bucket_width: int = 100, capacity: int = 1024):
+        self.bucket_width = bucket_width
+        self.ready = False
+        self._loading: Optional[Dict[str, int]] = None
+        self._reset(capacity)
+    
+    def _reset(self, capacity: int):
+        self._scores: Dict[str, int] = {}
+        self._buckets: Dict[int, List[int]] = {}
+        self._tree = [0] * (capacity + 1)
+    
+    def _bucket(self, score: int) -> int:
+        return max(score, 0) // self.bucket_width
+    
+    def _grow(self, bucket: int):
+        capacity = len(self._tree) - 1
+        while bucket >= capacity:
+            capacity *= 2
+        
+        self._tree = [0] * (capacity + 1)
+        for b, scores in self._buckets.items():
+            self._tree_add(b, len(scores))
+    
+    def _tree_add(self, bucket: int, delta: int):
+        i = bucket + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+    
+    def _tree_prefix(self, bucket: int) -> int:
+        """Number of scores in buckets strictly below `bucket`"""
+        i = min(bucket, len(self._tree) - 1)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+    
+    def _add(self, score: int):
+        bucket = self._bucket(score)
+        if bucket >= len(self._tree) - 1:
+            self._grow(bucket)
+        bisect.insort(self._buckets.setdefault(bucket, []), score)
+        self._tree_add(bucket, 1)
+    
+    def _remove(self, score: int):
+        bucket = self._bucket(score)
+        scores = self._buckets[bucket]
+        del scores[bisect.bisect_left(scores, score)]
+        if not scores:
+            del self._buckets[bucket]
+        self._tree_add(bucket, -1)
+    
+    def __len__(self) -> int:
+        return len(self._scores)
+    
+    def get(self, user_id: str) -> Optional[int]:
+        return self._scores.get(user_id)
+    
+    def update(self, user_id: str, score: int):
+        """Set a user's high score"""
+        if self._loading is not None:
+            self._loading[user_id] = score
+        
+        previous = self._scores.get(user_id)
+        if previous == score:
+            return
+        if previous is not None:
+            self._remove(previous)
+        self._scores[user_id] = score
+        self._add(score)
+    
+    def apply_update(self, message: dict):
+        """Apply a new high score broadcast by another worker"""
+        user_id = message["user_id"]
+        self.update(user_id, max(message["score"], self.get(user_id) or 0))
+    
+    def count_above(self, score: int) -> int:
+        """Number of users with a strictly higher score"""
+        bucket = self._bucket(score)
+        at_or_below = self._tree_prefix(bucket)
+        at_or_below += bisect.bisect_right(self._buckets.get(bucket, []), score)
+        return len(self._scores) - at_or_below
+    
+    def rank(self, score: int) -> int:
+        return self.count_above(score) + 1
+    
+    def rank_of(self, user_id: str) -> Optional[int]:
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self.rank(score)
+    
+    async def load(self, db):
+        """Rebuild the index from users.game_stats.high_score"""
+        fresh = RankIndex(self.bucket_width, len(self._tree) - 1)
+        self._loading = {}
+        try:
+            cursor = db.users.find({}, {"_id": 0, "user_id": 1, "game_stats.high_score": 1})
+            async for user in cursor:
+                fresh.update(user["user_id"], user.get("game_stats", {}).get("high_score", 0))
+            
+            # Replay scores submitted while the scan was running
+            for user_id, score in self._loading.items():
+                fresh.update(user_id, max(score, fresh.get(user_id) or 0))
+        finally:
+            self._loading = None
+        
+        # Swap in one step so readers never observe a half-built index
+        self._scores, self._buckets, self._tree = fresh._scores, fresh._buckets, fresh._tree
+        self.ready = True
+    
+    async def reconcile_forever(self, db, interval_seconds: int):
+        """Periodically reload the index to absorb writes from other workers"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.load(db)
+            except Exception:
+                logger.exception("Rank index reconciliation failed")
+
+rank_index = RankIndex()
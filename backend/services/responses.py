@@ -0,0 +1,67 @@
+import hashlib
+from typing import Any, Optional
+
+import orjson
+import pydantic_core
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+def dump_model(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def render_json(content: Any) -> bytes:
+    """Compact JSON bytes for models, documents and plain values"""
+    if isinstance(content, BaseModel) or (
+        isinstance(content, list) and content and isinstance(content[0], BaseModel)
+    ):
+        # pydantic's own serializer walks models faster than dumping them to dicts
+        return pydantic_core.to_json(content)
+    return orjson.dumps(content, default=dump_model, option=orjson.OPT_NON_STR_KEYS)
+
+class TrustedJSONResponse(Response):
+    """JSON response for data the server built from its own models.
+    
+    Returning a Response skips FastAPI's response_model validation and
+    jsonable_encoder pass; the route's response_model still documents it.
+    """
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the exact response bytes"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag"""
+    if not if_none_match:
+        return False
+    
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+class PrerenderedJSON:
+    """A JSON payload serialized to bytes once and served with an ETag"""
+    
+    def __init__(self, content: Any, max_age: int = 0):
+        self.body = render_json(content)
+        self.etag = make_etag(self.body)
+        self.max_age = max_age
+    
+    def response(self, request: Request) -> Response:
+        """Full response, or 304 Not Modified when the client has this version"""
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={self.max_age}"
+        }
+        
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        
+        return Response(self.body, media_type="application/json", headers=headers)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from services.config import config_cache
+
+logger = logging.getLogger(__name__)
+
+# Compaction batches each daily summary remembers, to skip re-folding a batch
+MAX_REMEMBERED_BATCHES = 20
+
+async def acquire_job_lock(db, name: str, lease: timedelta) -> bool:
+    """Take a lease on a periodic job so only one worker runs it at a time"""
+    now = datetime.utcnow()
+    try:
+        await db.job_locks.update_one(
+            {"_id": name, "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + lease}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease
+        return False
+    return True
+
+async def compact_leaderboard(db, history_days: int, summary_days: int) -> int:
+    """Fold old leaderboard rows into per-user/per-day summaries.
+    
+    Per-user best scores live in leaderboard_best, so once a game is older
+    than `history_days` only its contribution to the daily summary is kept.
+    Summaries older than `summary_days` are deleted. Returns the number of
+    leaderboard rows compacted.
+    
+    Rows are first tagged with a batch ID; only tagged rows are folded and
+    deleted, and each summary remembers the batches folded into it, so a
+    run that dies part-way is finished by the next one without counting
+    any row twice.
+    """
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    cutoff = today - timedelta(days=history_days)
+    
+    await db.leaderboard.update_many(
+        {"timestamp": {"$lt": cutoff}, "compaction_batch": {"$exists": False}},
+        {"$set": {"compaction_batch": uuid.uuid4().hex}}
+    )
+    
+    compacted = 0
+    for batch in await db.leaderboard.distinct("compaction_batch", {"compaction_batch": {"$exists": True}}):
+        await fold_batch(db, batch)
+        compacted += (await db.leaderboard.delete_many({"compaction_batch": batch})).deleted_count
+    
+    await db.leaderboard_daily_summaries.delete_many({
+        "day": {"$lt": today - timedelta(days=summary_days)}
+    })
+    return compacted
+
+async def fold_batch(db, batch: str):
+    """Merge one batch of tagged rows into the summaries, at most once per summary"""
+    already_folded = {"$in": [batch, {"$ifNull": ["$batches", []]}]}
+    
+    pipeline = [
+        {"$match": {"compaction_batch": batch}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "day": {"$dateFromParts": {
+                    "year": {"$year": "$timestamp"},
+                    "month": {"$month": "$timestamp"},
+                    "day": {"$dayOfMonth": "$timestamp"}
+                }}
+            },
+            "username": {"$last": "$username"},
+            "games": {"$sum": 1},
+            "best_score": {"$max": "$score"},
+            "total_score": {"$sum": "$score"},
+            "max_level": {"$max": "$level"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "day": "$_id.day",
+            "username": 1,
+            "games": 1,
+            "best_score": 1,
+            "total_score": 1,
+            "max_level": 1,
+            "batches": {"$literal": [batch]}
+        }},
+        {"$merge": {
+            "into": "leaderboard_daily_summaries",
+            "on": ["user_id", "day"],
+            "whenMatched": [{"$set": {
+                "username": {"$cond": [already_folded, "$username", "$$new.username"]},
+                "games": {"$cond": [already_folded, "$games", {"$add": ["$games", "$$new.games"]}]},
+                "best_score": {"$max": ["$best_score", "$$new.best_score"]},
+                "total_score": {"$cond": [
+                    already_folded, "$total_score", {"$add": ["$total_score", "$$new.total_score"]}
+                ]},
+                "max_level": {"$max": ["$max_level", "$$new.max_level"]},
+                # Only the latest batches are needed to recognise a retry
+                "batches": {"$cond": [
+                    already_folded,
+                    "$batches",
+                    {"$slice": [{"$concatArrays": [{"$ifNull": ["$batches", []]}, [batch]]}, -MAX_REMEMBERED_BATCHES]}
+                ]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+    await db.leaderboard.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+async def compact_forever(db, interval_seconds: int = 3600):
+    """Run leaderboard compaction on one worker per interval"""
+    while True:
+        try:
+            if await acquire_job_lock(db, "leaderboard_compaction", timedelta(seconds=interval_seconds)):
+                config = config_cache.get()
+                compacted = await compact_leaderboard(
+                    db, config.leaderboard_history_days, config.leaderboard_summary_days
+                )
+                if compacted:
+                    logger.info("Compacted %d leaderboard rows", compacted)
+        except Exception:
+            logger.exception("Leaderboard compaction failed")
+        await asyncio.sleep(interval_seconds)
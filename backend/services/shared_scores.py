@@ -0,0 +1,50 @@
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+# Shared scores are stored in per-user buckets of this many entries, so
+# the user document stays the same size however often a player shares.
+# Buckets are numbered by `seq`, unique per user, and only the highest
+# numbered one is ever appended to.
+SHARED_SCORE_BUCKET_SIZE = 50
+
+async def record_shared_score(db, user_id: str, entry: dict):
+    """Append a shared score to the user's newest bucket, starting a new one when it is full"""
+    newest = await db.shared_scores.find_one({"user_id": user_id}, {"seq": 1}, sort=[("seq", -1)])
+    seq = newest["seq"] if newest else 1
+    
+    while True:
+        try:
+            await db.shared_scores.update_one(
+                {"user_id": user_id, "seq": seq, "count": {"$lt": SHARED_SCORE_BUCKET_SIZE}},
+                {
+                    "$push": {"scores": entry},
+                    "$inc": {"count": 1},
+                    "$setOnInsert": {"started_at": entry["timestamp"]}
+                },
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            # Bucket `seq` is full; the next one may already have been started
+            seq += 1
+
+async def get_shared_scores_page(db, user_id: str, cursor: Optional[str] = None) -> dict:
+    """One bucket of shared scores, newest first, and the cursor for the next"""
+    query = {"user_id": user_id}
+    if cursor:
+        try:
+            query["seq"] = {"$lt": int(cursor)}
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    
+    buckets = await db.shared_scores.find(query).sort("seq", -1).limit(2).to_list(2)
+    if len(buckets) > 1:
+        return {"scores": buckets[0]["scores"][::-1], "next_cursor": str(buckets[0]["seq"])}
+    
+    # Shares from before the buckets existed are older than all of them
+    scores = buckets[0]["scores"][::-1] if buckets else []
+    user = await db.users.find_one({"user_id": user_id}, {"_id": 0, "shared_scores": 1})
+    if user:
+        scores += user.get("shared_scores", [])[::-1]
+    return {"scores": scores, "next_cursor": None}
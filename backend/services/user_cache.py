@@ -0,0 +1,122 @@
+import itertools
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from services.bus import publish
+
+# Unbounded histories; these are never cached and always read from MongoDB
+UNCACHED_FIELDS = ("purchases", "shared_scores", "friends")
+CACHED_PROJECTION = {"_id": 0, **{field: 0 for field in UNCACHED_FIELDS}}
+
+class UserCache:
+    """Read-through LRU cache of user documents with a TTL.
+    
+    Every write to a user increments its `revision`. An entry is only
+    replaced by a document with an equal or newer revision, and an
+    invalidation blocks any read that started before it from repopulating
+    the entry, so a slow read can't put back data older than a write.
+    """
+    
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 30):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_id -> (clock value of the invalidation, minimum revision)
+        self._invalidations: "OrderedDict[str, tuple]" = OrderedDict()
+        self._clock = itertools.count()
+    
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        
+        expires_at, document = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            return None
+        
+        self._entries.move_to_end(user_id)
+        return document
+    
+    def put(self, document: dict, read_started: Optional[int] = None):
+        """Cache a user document unless newer data is already known"""
+        document = {k: v for k, v in document.items() if k not in UNCACHED_FIELDS}
+        user_id = document["user_id"]
+        revision = document.get("revision", 0)
+        
+        invalidated_at, min_revision = self._invalidations.get(user_id, (-1, 0))
+        if revision < min_revision:
+            return
+        if read_started is not None and read_started < invalidated_at:
+            return
+        
+        current = self._entries.get(user_id)
+        if current is not None and current[1].get("revision", 0) > revision:
+            return
+        
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, document)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def replace(self, document: dict):
+        """Cache a document just returned by a write"""
+        self.invalidate(document["user_id"], document.get("revision", 0))
+        self.put(document)
+    
+    def invalidate(self, user_id: str, revision: Optional[int] = None):
+        """Drop a user after a write, optionally recording the revision it produced.
+        
+        The invalidation is also broadcast to the other workers.
+        """
+        self._invalidate(user_id, revision)
+        publish("user", {"user_id": user_id, "revision": revision})
+    
+    def apply_invalidation(self, message: dict):
+        """Apply an invalidation broadcast by another worker"""
+        self._invalidate(message["user_id"], message.get("revision"))
+    
+    def _invalidate(self, user_id: str, revision: Optional[int]):
+        self._entries.pop(user_id, None)
+        
+        _, min_revision = self._invalidations.pop(user_id, (-1, 0))
+        if revision is not None:
+            min_revision = max(min_revision, revision)
+        self._invalidations[user_id] = (next(self._clock), min_revision)
+        while len(self._invalidations) > self.max_size:
+            self._invalidations.popitem(last=False)
+    
+    async def get_or_load(self, db, user_id: str) -> Optional[dict]:
+        """Cached user document without UNCACHED_FIELDS, read from MongoDB on a miss"""
+        document = self.get(user_id)
+        if document is not None:
+            return document
+        
+        read_started = next(self._clock)
+        document = await db.users.find_one({"user_id": user_id}, CACHED_PROJECTION)
+        if document is not None:
+            self.put(document, read_started)
+        return document
+
+user_cache = UserCache()
+
+async def get_user_cache():
+    return user_cache
+
+def project_document(document: dict, fields) -> dict:
+    """In-memory equivalent of a MongoDB inclusion projection on dotted fields"""
+    projected = {}
+    for field in fields:
+        parts = field.split(".")
+        value = document
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
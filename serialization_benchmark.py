@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark for Butterfly Nebula Brawl Backend
+Compares FastAPI's default response path (response_model validation and
+serialization, then the app's ORJSONResponse) with the direct path used
+for trusted models,
+and reports gzip/brotli sizes for the same payloads
+"""
+
+import asyncio
+import gzip
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from fastapi.responses import ORJSONResponse
+
+from models.user import User, LeaderboardEntry, FluttererProgress, GameStats
+from services.compression import brotli
+from services.responses import TrustedJSONResponse
+
+ITERATIONS = 2000
+
+def build_leaderboard(size):
+    now = datetime.utcnow()
+    return [
+        LeaderboardEntry(
+            user_id=str(uuid.uuid4()),
+            username=f"pilot_{i}",
+            score=100000 - i * 37,
+            level=50 - i // 10,
+            flutterer_used="epic_blaster_wing",
+            timestamp=now - timedelta(minutes=i),
+            rank=i + 1
+        )
+        for i in range(size)
+    ]
+
+def build_user():
+    now = datetime.utcnow()
+    return User(
+        username="benchmark_pilot",
+        device_id=str(uuid.uuid4()),
+        platform="android",
+        cosmic_coins=12345,
+        flutterer_progress={
+            f"flutterer_{i}": FluttererProgress(flutterer_id=f"flutterer_{i}", unlocked=True, usage_count=i)
+            for i in range(20)
+        },
+        game_stats=GameStats(high_score=98765, games_played=400, max_level=42),
+        friends=[str(uuid.uuid4()) for _ in range(50)],
+        created_at=now,
+        last_active=now
+    )
+
+def trusted_path(content):
+    """What the handlers do now: render the models directly, skipping re-validation"""
+    return TrustedJSONResponse(content).body
+
+def time_it(func, *args):
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+async def time_default_path(field, content):
+    """What FastAPI does when a handler returns models for a response_model.
+
+    Timed inside one coroutine so event loop overhead isn't counted.
+    """
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        serialized = await serialize_response(field=field, response_content=content)
+        ORJSONResponse(serialized).body
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+def benchmark(name, response_type, content):
+    field = create_response_field(name="response", type_=response_type, mode="serialization")
+
+    default_us = asyncio.run(time_default_path(field, content))
+    trusted_us = time_it(trusted_path, content)
+    body = trusted_path(content)
+
+    print(f"📦 {name}")
+    print(f"   default (validate + serialize + ORJSONResponse): {default_us:8.1f} µs")
+    print(f"   trusted (no re-validation):                      {trusted_us:8.1f} µs  (speedup {default_us / trusted_us:.2f}x)")
+    print(f"   body: {len(body)} bytes, gzip: {len(gzip.compress(body, compresslevel=6))} bytes", end="")
+    if brotli is not None:
+        print(f", brotli: {len(brotli.compress(body, quality=4))} bytes")
+    else:
+        print(" (brotli not installed)")
+    print()
+
+if __name__ == "__main__":
+    print(f"Median of {ITERATIONS} iterations\n")
+    benchmark("Leaderboard, 50 entries", List[LeaderboardEntry], build_leaderboard(50))
+    benchmark("Leaderboard, 100 entries", List[LeaderboardEntry], build_leaderboard(100))
+    benchmark("Full user document", User, build_user())
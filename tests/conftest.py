@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db():
+    """A fresh in-memory database with the app's indexes"""
+    database.db.client = AsyncMongoMockClient()
+    database.db.database = database.db.client["butterfly_nebula_test"]
+    await database.create_indexes()
+    yield database.db.database
+    database.db.client = None
+    database.db.database = None
@@ -0,0 +1,141 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import ReturnDocument
+
+from api.users import SCORE_PROJECTION, score_rewards, score_update_pipeline
+from models.game import GameConfig
+from models.user import ScoreSubmission
+from services.challenges import challenge_set, evaluate_challenges, todays_challenges
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2025, 3, 14, 12, 0)
+
+def run(score: int = 100, level: int = 1, survival_time: int = 10, enemies_defeated: int = 1) -> ScoreSubmission:
+    return ScoreSubmission(
+        user_id="pilot",
+        score=score,
+        level=level,
+        survival_time=survival_time,
+        enemies_defeated=enemies_defeated,
+        flutterer_used="basic_flutter"
+    )
+
+@pytest.fixture
+async def pilot(db):
+    await db.users.insert_one({"user_id": "pilot", "device_id": "device", "username": "pilot", "cosmic_coins": 0})
+
+async def submit(db, scores, now: datetime = NOW) -> tuple:
+    """Apply runs through the pipeline; returns the user before and after"""
+    before = await db.users.find_one_and_update(
+        {"user_id": "pilot"},
+        score_update_pipeline("pilot", scores, GameConfig(), now),
+        projection=SCORE_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    after = await db.users.find_one({"user_id": "pilot"}, {"_id": 0})
+    return {**before, "user_id": "pilot"}, after
+
+def stored_challenges(user: dict) -> dict:
+    return {challenge["challenge_id"]: challenge for challenge in user["daily_challenges"]}
+
+def challenge_id(challenge_type: str, now: datetime = NOW) -> str:
+    return f"{now.date().isoformat()}:{challenge_type}"
+
+def todays_types(now: datetime = NOW) -> set:
+    return {template["type"] for template in challenge_set("pilot", now.date().isoformat())}
+
+def test_challenge_set_is_stable_per_user_and_day():
+    day = NOW.date().isoformat()
+    templates = challenge_set("pilot", day)
+    
+    assert challenge_set("pilot", day) == templates
+    assert len({template["type"] for template in templates}) == len(templates)
+
+def test_stored_progress_from_earlier_days_is_ignored():
+    yesterday = NOW - timedelta(days=1)
+    challenge_type = challenge_set("pilot", yesterday.date().isoformat())[0]["type"]
+    user = {"user_id": "pilot", "daily_challenges": [{
+        "challenge_id": challenge_id(challenge_type, yesterday),
+        "created_date": yesterday.date().isoformat(),
+        "progress": 10_000,
+        "completed": True
+    }]}
+    
+    assert all(challenge.progress == 0 and not challenge.completed for challenge in todays_challenges(user, NOW))
+
+@pytest.mark.parametrize("seed", range(15))
+async def test_pipeline_matches_evaluate_challenges(db, pilot, seed):
+    rng = random.Random(seed)
+    config = GameConfig()
+    
+    for _ in range(4):
+        scores = [
+            run(rng.randrange(6000), rng.randrange(1, 12), rng.randrange(80), rng.randrange(30))
+            for _ in range(rng.randrange(1, 4))
+        ]
+        before, after = await submit(db, scores)
+    
+        stats = before.get("game_stats", {})
+        results = score_rewards(stats.get("high_score", 0), stats.get("max_level", 1), scores, config)
+        completed = evaluate_challenges(before, scores, NOW)
+        assert after["cosmic_coins"] == (
+            before["cosmic_coins"]
+            + sum(result["coins_awarded"] for result in results)
+            + sum(challenge.reward_coins for challenge in completed)
+        )
+    
+        # Exactly the challenges evaluate_challenges reports were completed by this update
+        stored = stored_challenges(after)
+        completed_before = {challenge.challenge_id for challenge in todays_challenges(before, NOW) if challenge.completed}
+        assert {
+            key for key, challenge in stored.items() if challenge["completed"] and key not in completed_before
+        } == {challenge.challenge_id for challenge in completed}
+        for challenge in stored.values():
+            assert "_rewarded" not in challenge
+            assert challenge["completed"] == (challenge["progress"] >= challenge["target_value"])
+
+async def test_cumulative_challenges_add_up_across_submissions(db, pilot):
+    await submit(db, [run(survival_time=70, enemies_defeated=30)])
+    _, after = await submit(db, [run(survival_time=60, enemies_defeated=25)])
+    
+    stored = stored_challenges(after)
+    for challenge_type, progress in (("survival", 130), ("enemies", 55)):
+        if challenge_type in todays_types():
+            assert stored[challenge_id(challenge_type)]["progress"] == progress
+            assert stored[challenge_id(challenge_type)]["completed"]
+
+async def test_best_run_challenges_keep_the_best_value(db, pilot):
+    await submit(db, [run(score=4000, level=8)])
+    _, after = await submit(db, [run(score=1000, level=2)])
+    
+    stored = stored_challenges(after)
+    for challenge_type, progress in (("score", 4000), ("level", 8)):
+        if challenge_type in todays_types():
+            assert stored[challenge_id(challenge_type)]["progress"] == progress
+            assert not stored[challenge_id(challenge_type)]["completed"]
+
+async def test_challenge_reward_is_paid_once(db, pilot):
+    best = run(score=6000, level=12, survival_time=150, enemies_defeated=60)
+    reward = sum(template["reward"] for template in challenge_set("pilot", NOW.date().isoformat()))
+    config = GameConfig()
+    
+    before, after = await submit(db, [best])
+    assert len(evaluate_challenges(before, [best], NOW)) == len(todays_types())
+    assert after["cosmic_coins"] - before["cosmic_coins"] == score_rewards(0, 1, [best], config)[0]["coins_awarded"] + reward
+    
+    before, after = await submit(db, [best])
+    assert evaluate_challenges(before, [best], NOW) == []
+    assert after["cosmic_coins"] - before["cosmic_coins"] == score_rewards(best.score, best.level, [best], config)[0]["coins_awarded"]
+    assert all(challenge["completion_date"] == NOW for challenge in after["daily_challenges"])
+
+async def test_a_new_day_starts_fresh_challenges(db, pilot):
+    await submit(db, [run(score=6000, level=12, survival_time=150, enemies_defeated=60)])
+    tomorrow = NOW + timedelta(days=1)
+    
+    _, after = await submit(db, [run()], tomorrow)
+    
+    assert {challenge["created_date"] for challenge in after["daily_challenges"]} == {tomorrow.date().isoformat()}
+    assert not any(challenge["completed"] for challenge in after["daily_challenges"])
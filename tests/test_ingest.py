@@ -0,0 +1,145 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import api.game
+from api.game import track_events
+from services.ingest import BufferedInserter, analytics_buffer, iter_json_documents
+
+pytestmark = pytest.mark.anyio
+
+EVENTS = [{"n": 1, "text": "héllo 🦋"}, {"n": 2, "nested": {"list": [1, {"deep": "]"}]}}, {"n": 3}]
+
+async def chunked(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+async def decode(body: bytes, size: int = 4096, **kwargs) -> list:
+    return [document async for document in iter_json_documents(chunked(body, size), **kwargs)]
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 4096])
+async def test_array_across_chunk_boundaries(size):
+    body = json.dumps(EVENTS, ensure_ascii=False).encode()
+    assert await decode(body, size) == EVENTS
+
+@pytest.mark.parametrize("size", [1, 5, 4096])
+async def test_ndjson(size):
+    body = "\n".join(json.dumps(event, ensure_ascii=False) for event in EVENTS).encode() + b"\n"
+    assert await decode(body, size) == EVENTS
+
+async def test_utf8_split_inside_a_character():
+    body = json.dumps([{"emoji": "🦋"}], ensure_ascii=False).encode()
+    split = body.index("🦋".encode()) + 1
+    
+    async def two_chunks():
+        yield body[:split]
+        yield body[split:]
+    
+    assert [document async for document in iter_json_documents(two_chunks())] == [{"emoji": "🦋"}]
+
+@pytest.mark.parametrize("body", [b"[]", b"  [ ]  ", b"", b"\n"])
+async def test_empty_bodies(body):
+    assert await decode(body) == []
+
+@pytest.mark.parametrize("body", [
+    b'[,,{"a":1}{"b":2}]',
+    b'[{"a":1},]',
+    b'[{"a":1},,{"b":2}]',
+    b'[{"a":1} {"b":2}]',
+    b'{"a":1},{"b":2}',
+    b'[{"a":1}',
+    b'[{"a":1},{"b":',
+    b'[{"a":1}] trailing',
+    b'[1, 2]',
+    b'{"a": tru}',
+    b'"text"'
+])
+@pytest.mark.parametrize("size", [1, 4096])
+async def test_malformed_bodies_are_rejected(body, size):
+    with pytest.raises(ValueError):
+        await decode(body, size)
+
+async def test_documents_before_an_error_are_yielded():
+    seen = []
+    with pytest.raises(ValueError):
+        async for document in iter_json_documents(chunked(b'[{"a":1},{"b":2},oops]', 4096)):
+            seen.append(document)
+    assert seen == [{"a": 1}, {"b": 2}]
+
+async def test_oversized_document_is_rejected():
+    body = json.dumps([{"blob": "x" * 1000}]).encode()
+    with pytest.raises(ValueError):
+        await decode(body, 100, max_document_size=500)
+
+class StreamedRequest:
+    """Just enough of a Request for track_events"""
+    
+    def __init__(self, body: bytes, size: int = 64):
+        self.body = body
+        self.size = size
+    
+    def stream(self):
+        return chunked(self.body, self.size)
+
+def analytics_event(n: int) -> dict:
+    return {
+        "user_id": "pilot",
+        "event_type": "level_complete",
+        "event_data": {"n": n},
+        "session_id": "session",
+        "platform": "web",
+        "app_version": "1.0.0"
+    }
+
+@pytest.fixture
+async def buffer(db):
+    analytics_buffer.start(db)
+    yield analytics_buffer
+    await analytics_buffer.stop()
+
+async def test_batch_reports_accepted_and_rejected(db, buffer):
+    events = [analytics_event(0), {"event_type": "missing fields"}, analytics_event(2)]
+    
+    result = await track_events(StreamedRequest(json.dumps(events).encode()))
+    await buffer.stop()
+    
+    assert result["accepted"] == 2
+    assert [rejected["index"] for rejected in result["rejected"]] == [1]
+    assert not result["truncated"]
+    assert await db.analytics.count_documents({}) == 2
+
+async def test_oversized_batch_is_truncated_not_rejected(db, buffer, monkeypatch):
+    monkeypatch.setattr(api.game, "MAX_ANALYTICS_BATCH", 2)
+    events = [analytics_event(n) for n in range(4)]
+    
+    result = await track_events(StreamedRequest(json.dumps(events).encode()))
+    
+    assert result["truncated"]
+    assert result["accepted"] == 2
+    assert result["next_index"] == 2
+
+async def test_malformed_tail_reports_progress(db, buffer):
+    body = json.dumps([analytics_event(0), analytics_event(1)]).encode()[:-1] + b',{"broken"'
+    
+    with pytest.raises(HTTPException) as error:
+        await track_events(StreamedRequest(body))
+    
+    assert error.value.status_code == 400
+    assert error.value.detail["accepted"] == 2
+    assert error.value.detail["next_index"] == 2
+
+async def test_full_buffer_reports_progress(db, monkeypatch):
+    full = BufferedInserter("analytics", max_queue=1, put_timeout=0.01)
+    monkeypatch.setattr(api.game, "analytics_buffer", full)
+    full.start(db)
+    # Hold the queue so nothing is flushed while the batch is parsed
+    full._task.cancel()
+    
+    body = json.dumps([analytics_event(n) for n in range(3)]).encode()
+    with pytest.raises(HTTPException) as error:
+        await track_events(StreamedRequest(body))
+    
+    assert error.value.status_code == 503
+    assert error.value.detail["accepted"] == 1
+    assert error.value.detail["next_index"] == 1
@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+
+import pytest
+from fastapi import HTTPException
+
+import api.game
+from api.game import verify_purchase
+from database import ensure_unique_transaction_ids
+from models.user import Purchase
+from services.purchases import COIN_PACKS, MAX_GRANTED_TRANSACTIONS, RecentTransactions
+from services.user_cache import user_cache
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def recent_transactions(monkeypatch):
+    """A fresh replay cache per test, so replays reach the database"""
+    recent = RecentTransactions()
+    monkeypatch.setattr(api.game, "recent_transactions", recent)
+    return recent
+
+@pytest.fixture
+async def users(db):
+    for user_id in ("pilot", "other"):
+        await db.users.insert_one({"user_id": user_id, "device_id": f"device-{user_id}", "username": user_id, "cosmic_coins": 0})
+
+class Interleaved:
+    """Database whose operations yield to the event loop first.
+    
+    mongomock-motor never suspends, so without this gathered handlers
+    would run one after another instead of racing.
+    """
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __getattr__(self, name):
+        return InterleavedCollection(getattr(self.db, name))
+
+class InterleavedCollection:
+    def __init__(self, collection):
+        self.collection = collection
+    
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+        
+        async def call(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await method(*args, **kwargs)
+        return call
+
+def coin_purchase(transaction_id: str, user_id: str = "pilot") -> Purchase:
+    return Purchase(
+        user_id=user_id,
+        item_type="coins",
+        item_id="medium",
+        price_usd=4.99,
+        platform="android",
+        transaction_id=transaction_id
+    )
+
+async def coins(db, user_id: str = "pilot") -> int:
+    return (await db.users.find_one({"user_id": user_id}))["cosmic_coins"]
+
+async def test_purchase_is_granted_once(db, users):
+    first = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    
+    assert not first["duplicate"]
+    assert await coins(db) == COIN_PACKS["medium"]
+    record = await db.purchases.find_one({"transaction_id": "t1"})
+    assert record["granted"]
+    assert record["purchase_id"] == first["purchase_id"]
+
+async def test_replay_returns_the_original_purchase(db, users, recent_transactions):
+    first = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    
+    # From the in-memory cache, then from the database as another worker would
+    cached = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    recent_transactions._entries.clear()
+    stored = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    
+    for replay in (cached, stored):
+        assert replay["duplicate"]
+        assert replay["purchase_id"] == first["purchase_id"]
+    assert await coins(db) == COIN_PACKS["medium"]
+    assert await db.purchases.count_documents({"transaction_id": "t1"}) == 1
+
+async def test_concurrent_claims_grant_once(db, users):
+    responses = await asyncio.gather(*[
+        verify_purchase(coin_purchase("t1"), Interleaved(db), user_cache) for _ in range(10)
+    ])
+    
+    assert sum(not response["duplicate"] for response in responses) == 1
+    assert len({response["purchase_id"] for response in responses}) == 1
+    assert await coins(db) == COIN_PACKS["medium"]
+    assert await db.purchases.count_documents({"transaction_id": "t1"}) == 1
+
+async def test_concurrent_claims_by_different_users(db, users):
+    results = await asyncio.gather(*[
+        verify_purchase(coin_purchase("t1", user_id), Interleaved(db), user_cache)
+        for user_id in ("pilot", "other") * 3
+    ], return_exceptions=True)
+    
+    granted = [result for result in results if isinstance(result, dict)]
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(granted) == 3 and len(rejected) == 3
+    assert {error.status_code for error in rejected} == {409}
+    assert sorted([await coins(db), await coins(db, "other")]) == [0, COIN_PACKS["medium"]]
+
+async def test_transaction_used_by_another_user_is_rejected(db, users, recent_transactions):
+    await verify_purchase(coin_purchase("t1"), db, user_cache)
+    
+    for clear_cache in (False, True):
+        if clear_cache:
+            recent_transactions._entries.clear()
+        with pytest.raises(HTTPException) as error:
+            await verify_purchase(coin_purchase("t1", "other"), db, user_cache)
+        assert error.value.status_code == 409
+    assert await coins(db, "other") == 0
+
+async def test_unfinished_claim_is_completed_by_the_retry(db, users):
+    # A worker claimed the transaction and died before granting it
+    purchase = coin_purchase("t1")
+    await db.purchases.insert_one({**purchase.dict(), "granted": False})
+    
+    response = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    
+    assert response["purchase_id"] == purchase.purchase_id
+    assert await coins(db) == COIN_PACKS["medium"]
+    assert (await db.purchases.find_one({"transaction_id": "t1"}))["granted"]
+
+async def test_claim_is_released_for_unknown_users(db, users):
+    with pytest.raises(HTTPException) as error:
+        await verify_purchase(coin_purchase("t1", "nobody"), db, user_cache)
+    
+    assert error.value.status_code == 404
+    assert await db.purchases.count_documents({"transaction_id": "t1"}) == 0
+    
+    # The transaction can still be granted to the right account
+    response = await verify_purchase(coin_purchase("t1"), db, user_cache)
+    assert not response["duplicate"]
+
+async def test_missing_transaction_id_is_rejected(db, users):
+    with pytest.raises(HTTPException) as error:
+        await verify_purchase(coin_purchase(None), db, user_cache)
+    assert error.value.status_code == 400
+
+async def test_granted_transactions_stay_bounded(db, users):
+    for n in range(MAX_GRANTED_TRANSACTIONS + 5):
+        await verify_purchase(coin_purchase(f"t{n}"), db, user_cache)
+    
+    user = await db.users.find_one({"user_id": "pilot"})
+    assert len(user["granted_transactions"]) == MAX_GRANTED_TRANSACTIONS
+    assert user["granted_transactions"][-1] == f"t{MAX_GRANTED_TRANSACTIONS + 4}"
+
+async def test_duplicate_transactions_are_collapsed_before_indexing(db):
+    await db.purchases.drop_indexes()
+    await db.purchases.create_index("transaction_id")
+    await db.purchases.insert_many([
+        {"purchase_id": "first", "transaction_id": "t1"},
+        {"purchase_id": "replay", "transaction_id": "t1"},
+        {"purchase_id": "other", "transaction_id": "t2"}
+    ])
+    
+    await ensure_unique_transaction_ids(db)
+    
+    records = await db.purchases.find({}, {"_id": 0}).sort("purchase_id", 1).to_list(None)
+    assert records == [
+        {"purchase_id": "first", "transaction_id": "t1", "granted": True},
+        {"purchase_id": "other", "transaction_id": "t2", "granted": True}
+    ]
+    indexes = await db.purchases.index_information()
+    assert indexes["transaction_id_unique"]["unique"]
+    assert "transaction_id_1" not in indexes
@@ -0,0 +1,122 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from services.ranking import RankIndex
+
+class ScanningCollection:
+    """Runs a callback once find() has started reading the collection"""
+    
+    def __init__(self, collection, on_scan):
+        self.collection = collection
+        self.on_scan = on_scan
+    
+    def find(self, *args, **kwargs):
+        cursor = self.collection.find(*args, **kwargs)
+        self.on_scan()
+        return cursor
+
+def brute_force_rank(scores: dict, score: int) -> int:
+    return sum(1 for other in scores.values() if other > score) + 1
+
+def test_rank_matches_brute_force():
+    rng = random.Random(7)
+    index = RankIndex(bucket_width=50, capacity=4)
+    scores = {}
+    
+    for _ in range(2000):
+        user_id = f"user-{rng.randrange(300)}"
+        score = rng.randrange(0, 20000)
+        index.update(user_id, score)
+        scores[user_id] = score
+        
+        probe = rng.randrange(-10, 21000)
+        assert index.rank(probe) == brute_force_rank(scores, probe)
+    
+    assert len(index) == len(scores)
+    for user_id, score in scores.items():
+        assert index.rank_of(user_id) == brute_force_rank(scores, score)
+
+def test_ties_share_a_rank():
+    index = RankIndex(bucket_width=10)
+    for user_id, score in (("a", 100), ("b", 100), ("c", 105), ("d", 90)):
+        index.update(user_id, score)
+    
+    assert index.rank_of("c") == 1
+    assert index.rank_of("a") == index.rank_of("b") == 2
+    assert index.rank_of("d") == 4
+    assert index.rank_of("missing") is None
+
+def test_buckets_grow_past_capacity():
+    index = RankIndex(bucket_width=10, capacity=2)
+    index.update("low", 5)
+    index.update("high", 1_000_000)
+    
+    assert len(index._tree) - 1 > 1_000_000 // 10
+    assert index.rank_of("high") == 1
+    assert index.rank_of("low") == 2
+    assert index.count_above(999_999) == 1
+
+def test_negative_scores_share_the_lowest_bucket():
+    index = RankIndex(bucket_width=10)
+    index.update("a", -5)
+    index.update("b", 3)
+    
+    assert index.rank_of("b") == 1
+    assert index.rank_of("a") == 2
+
+def test_update_moves_a_user():
+    index = RankIndex(bucket_width=10)
+    index.update("a", 50)
+    index.update("b", 70)
+    index.update("a", 90)
+    
+    assert len(index) == 2
+    assert index.rank_of("a") == 1
+    assert index.rank(50) == 3
+
+def test_apply_update_never_lowers_a_score():
+    index = RankIndex()
+    index.update("a", 500)
+    index.apply_update({"user_id": "a", "device_id": "device-a", "score": 300})
+    assert index.get("a") == 500
+    
+    index.apply_update({"user_id": "a", "device_id": "device-a", "score": 800})
+    assert index.get("a") == 800
+
+@pytest.mark.anyio
+async def test_load_rebuilds_from_users(db):
+    await db.users.insert_many([
+        {"user_id": "a", "device_id": "device-a", "game_stats": {"high_score": 300}},
+        {"user_id": "b", "device_id": "device-b", "game_stats": {"high_score": 100}},
+        {"user_id": "c", "device_id": "device-c"}
+    ])
+    
+    index = RankIndex(bucket_width=10)
+    index.update("stale", 10_000)
+    await index.load(db)
+    
+    assert index.ready
+    assert index.get("stale") is None
+    assert [index.rank_of(user_id) for user_id in "abc"] == [1, 2, 3]
+
+@pytest.mark.anyio
+async def test_load_replays_scores_submitted_during_the_scan(db):
+    await db.users.insert_many([
+        {"user_id": "a", "device_id": "device-a", "game_stats": {"high_score": 300}},
+        {"user_id": "b", "device_id": "device-b", "game_stats": {"high_score": 100}}
+    ])
+    index = RankIndex(bucket_width=10)
+    
+    def submit_during_scan():
+        # Scores arrive after the scan has read the old values
+        index.update("b", 900)
+        index.update("new", 200)
+    
+    await index.load(SimpleNamespace(users=ScanningCollection(db.users, submit_during_scan)))
+    
+    assert index.get("b") == 900
+    assert index.get("new") == 200
+    assert index.rank_of("b") == 1
+    assert index._loading is None
@@ -0,0 +1,127 @@
+import random
+from datetime import datetime
+
+import pytest
+from pymongo import ReturnDocument
+
+from fastapi import HTTPException
+
+from api.users import MAX_SCORE_BATCH, SCORE_PROJECTION, apply_scores, score_rewards, score_update_pipeline, submit_scores
+from models.game import GameConfig
+from models.user import ScoreSubmission
+from services.challenges import evaluate_challenges
+from services.user_cache import user_cache
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2025, 3, 14, 12, 0)
+
+def run(score: int, level: int, survival_time: int = 30, enemies_defeated: int = 5) -> ScoreSubmission:
+    return ScoreSubmission(
+        user_id="pilot",
+        score=score,
+        level=level,
+        survival_time=survival_time,
+        enemies_defeated=enemies_defeated,
+        flutterer_used="basic_flutter"
+    )
+
+async def apply(db, user: dict, scores, config: GameConfig):
+    """Run the update pipeline and return the documents before and after"""
+    await db.users.insert_one({"user_id": "pilot", "device_id": "device", "username": "pilot", **user})
+    before = await db.users.find_one_and_update(
+        {"user_id": "pilot"},
+        score_update_pipeline("pilot", scores, config, NOW),
+        projection=SCORE_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    after = await db.users.find_one({"user_id": "pilot"}, {"_id": 0})
+    return before, after
+
+def expected_coins(before: dict, scores, config: GameConfig) -> int:
+    stats = before.get("game_stats", {})
+    results = score_rewards(stats.get("high_score", 0), stats.get("max_level", 1), scores, config)
+    completed = evaluate_challenges({**before, "user_id": "pilot"}, scores, NOW)
+    return (
+        before.get("cosmic_coins", 0)
+        + sum(result["coins_awarded"] for result in results)
+        + sum(challenge.reward_coins for challenge in completed)
+    )
+
+@pytest.mark.parametrize("user, score_data", [
+    ({}, run(100, 1)),
+    ({"cosmic_coins": 40, "game_stats": {"high_score": 500, "max_level": 3}}, run(400, 2)),
+    ({"cosmic_coins": 40, "game_stats": {"high_score": 500, "max_level": 3}}, run(600, 3)),
+    ({"cosmic_coins": 40, "game_stats": {"high_score": 500, "max_level": 3}}, run(900, 7)),
+    ({"game_stats": {"high_score": 900}}, run(900, 1))
+])
+async def test_single_run_matches_score_rewards(db, user, score_data):
+    config = GameConfig()
+    before, after = await apply(db, user, [score_data], config)
+    
+    previous = user.get("game_stats", {})
+    assert after["cosmic_coins"] == expected_coins(before, [score_data], config)
+    assert after["game_stats"]["high_score"] == max(previous.get("high_score", 0), score_data.score)
+    assert after["game_stats"]["max_level"] == max(previous.get("max_level", 1), score_data.level)
+    assert after["game_stats"]["games_played"] == 1
+    assert after["revision"] == 1
+
+async def test_record_bonus_uses_the_multiplier_from_config(db):
+    config = GameConfig(score_multiplier=0.5, base_coin_reward=3)
+    score_data = run(200, 1)
+    _, after = await apply(db, {"game_stats": {"high_score": 100}}, [score_data], config)
+    
+    results = score_rewards(100, 1, [score_data], config)
+    assert results[0]["coins_awarded"] == 100 + 3 + 50
+    assert results[0]["new_record"]
+    assert after["cosmic_coins"] == results[0]["coins_awarded"]
+
+@pytest.mark.parametrize("seed", range(20))
+async def test_batch_matches_score_rewards(db, seed):
+    rng = random.Random(seed)
+    config = GameConfig()
+    user = {
+        "cosmic_coins": rng.randrange(1000),
+        "game_stats": {"high_score": rng.randrange(3000), "max_level": rng.randrange(1, 8)}
+    }
+    # Kept below every daily challenge target, those are covered in test_challenges
+    scores = [
+        run(rng.randrange(4000), rng.randrange(1, 10), rng.randrange(15), rng.randrange(7))
+        for _ in range(rng.randrange(1, 8))
+    ]
+    before, after = await apply(db, user, scores, config)
+    
+    assert after["cosmic_coins"] == expected_coins(before, scores, config)
+    assert after["game_stats"]["high_score"] == max([user["game_stats"]["high_score"]] + [s.score for s in scores])
+    assert after["game_stats"]["max_level"] == max([user["game_stats"]["max_level"]] + [s.level for s in scores])
+    assert after["game_stats"]["games_played"] == len(scores)
+    assert after["game_stats"]["enemies_defeated"] == sum(s.enemies_defeated for s in scores)
+    assert after["game_stats"]["total_survival_time"] == sum(s.survival_time for s in scores)
+
+def test_only_runs_beating_earlier_runs_earn_record_bonuses():
+    config = GameConfig()
+    results = score_rewards(100, 1, [run(300, 1), run(200, 1), run(400, 1)], config)
+    assert [result["new_record"] for result in results] == [True, False, True]
+
+async def test_apply_scores_records_every_run(db):
+    await db.users.insert_one({"user_id": "pilot", "device_id": "device", "username": "pilot", "cosmic_coins": 10})
+    scores = [run(300, 2), run(700, 4), run(500, 3)]
+    
+    results, total_coins, _ = await apply_scores("pilot", scores, db, user_cache)
+    
+    user = await db.users.find_one({"user_id": "pilot"})
+    assert total_coins == user["cosmic_coins"]
+    assert [result["session_id"] for result in results] == [s.session_id for s in scores]
+    assert await db.leaderboard.count_documents({"user_id": "pilot"}) == 3
+    best = await db.leaderboard_best.find_one({"user_id": "pilot"})
+    assert best["score"] == 700
+
+async def test_apply_scores_rejects_unknown_users(db):
+    with pytest.raises(HTTPException) as error:
+        await apply_scores("nobody", [run(100, 1)], db, user_cache)
+    assert error.value.status_code == 404
+
+async def test_batch_size_is_limited(db):
+    with pytest.raises(HTTPException) as error:
+        await submit_scores("pilot", [run(1, 1)] * (MAX_SCORE_BATCH + 1), db, user_cache)
+    assert error.value.status_code == 400